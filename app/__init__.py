@@ -3,6 +3,20 @@ from flask_sqlalchemy import SQLAlchemy
 from flask_login import LoginManager
 from flask_socketio import SocketIO
 from flask_cors import CORS
+from app.admission import AdmissionController
+from app.chat_writer import ChatWriter
+from app.intents import IntentEngine
+from app.presence import PresenceRegistry
+from app.throttle import EventThrottles
+from app.support_queue import SupportQueue
+from app.identity_cache import IdentityCache
+from app.passwords import PasswordHasher
+from app.rate_limit import RateLimiter
+from app.sessions import SessionStore
+from app.metrics import Metrics
+from app.query_stats import QueryInspector
+from app.db_pool import PoolMonitor
+from app import schema
 from config import config
 import os
 
@@ -10,6 +24,19 @@ import os
 db = SQLAlchemy()
 login_manager = LoginManager()
 socketio = SocketIO()
+checkout_admission = AdmissionController(name='checkout')
+chat_writer = ChatWriter(socketio)
+intent_engine = IntentEngine()
+presence = PresenceRegistry()
+event_throttles = EventThrottles(socketio)
+support_queue = SupportQueue()
+identity_cache = IdentityCache()
+password_hasher = PasswordHasher(socketio)
+rate_limiter = RateLimiter()
+session_store = SessionStore()
+metrics = Metrics()
+query_inspector = QueryInspector(metrics)
+pool_monitor = PoolMonitor(metrics)
 
 def create_app(config_name='development'):
     """Application factory pattern"""
@@ -20,15 +47,34 @@ def create_app(config_name='development'):
     app.config.from_object(config[config_name])
     
     # Initialize extensions with app
+    metrics.init_app(app)
+    query_inspector.init_app(app)
+    pool_monitor.init_app(app)
     db.init_app(app)
+    session_store.init_app(app)
     login_manager.init_app(app)
     login_manager.login_view = 'auth.login'
     CORS(app)
+    checkout_admission.init_app(app)
+    chat_writer.init_app(app)
+    intent_engine.init_app(app)
+    presence.init_app(app)
+    event_throttles.init_app(app)
+    support_queue.init_app(app)
+    identity_cache.init_app(app)
+    password_hasher.init_app(app)
+    rate_limiter.init_app(app)
+    
+    # Import routes before SocketIO is initialized so that the chat event
+    # handlers are registered on every app's server, not just the first one
+    from app.routes import auth, products, cart, wishlist, checkout, chat, main
+    metrics.instrument_socketio(socketio)
     
     # Initialize SocketIO with Redis message queue for multi-server support
     socketio.init_app(
         app,
         message_queue=app.config['SOCKETIO_MESSAGE_QUEUE'],
+        async_mode=app.config['SOCKETIO_ASYNC_MODE'],
         cors_allowed_origins=app.config['SOCKETIO_CORS_ALLOWED_ORIGINS']
     )
     
@@ -36,8 +82,6 @@ def create_app(config_name='development'):
     os.makedirs(app.config['UPLOAD_FOLDER'], exist_ok=True)
     
     # Register blueprints
-    from app.routes import auth, products, cart, wishlist, checkout, chat, main
-    
     app.register_blueprint(main.bp)
     app.register_blueprint(auth.bp, url_prefix='/auth')
     app.register_blueprint(products.bp, url_prefix='/api/products')
@@ -46,8 +90,8 @@ def create_app(config_name='development'):
     app.register_blueprint(checkout.bp, url_prefix='/api/checkout')
     app.register_blueprint(chat.bp, url_prefix='/chat')
     
-    # Create database tables
-    with app.app_context():
-        db.create_all()
+    # Create or migrate the database tables; one query when already current
+    schema.ensure_schema(app)
+    app.cli.add_command(schema.upgrade_db_command)
     
     return app
@@ -0,0 +1,178 @@
+"""
+Admission control (virtual waiting room) for expensive endpoints
+
+Caps the number of requests running concurrently on this node. Requests that
+arrive while every slot is busy receive a queue token with their position and
+an estimated wait, and are admitted in FIFO order when they retry with it.
+"""
+
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from functools import wraps
+
+from flask import current_app, jsonify, request
+
+
+class AdmissionController:
+    """Per-node concurrency cap with a FIFO waiting room"""
+
+    def __init__(self, app=None, name='checkout', max_concurrent=10, max_queue=1000,
+                 token_ttl=30, default_service_time=0.5, clock=time.monotonic):
+        self.name = name
+        self.max_concurrent = max_concurrent
+        self.max_queue = max_queue
+        self.token_ttl = token_ttl
+        self.clock = clock
+        self.default_service_time = default_service_time
+        self._lock = threading.Lock()
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read limits from the app config"""
+        prefix = self.name.upper()
+        self.max_concurrent = app.config.get(f'{prefix}_MAX_CONCURRENT', self.max_concurrent)
+        self.max_queue = app.config.get(f'{prefix}_MAX_QUEUE', self.max_queue)
+        self.token_ttl = app.config.get(f'{prefix}_QUEUE_TOKEN_TTL', self.token_ttl)
+        app.extensions[f'{self.name}_admission'] = self
+        self.reset()
+
+    def reset(self):
+        """Clear all slots, queued tokens and counters"""
+        self._active = 0
+        self._queue = OrderedDict()  # token -> last time the client polled
+        self._service_time = self.default_service_time  # EWMA of slot hold time
+        self._admitted_total = 0
+        self._queued_total = 0
+        self._rejected_total = 0
+        self._expired_total = 0
+
+    def _expire(self, now):
+        """Drop tokens whose clients stopped polling so they don't block the line"""
+        stale = [t for t, seen in self._queue.items() if now - seen > self.token_ttl]
+        for token in stale:
+            del self._queue[token]
+            self._expired_total += 1
+
+    def _ticket(self, token, position):
+        """Describe a queued request's place in line"""
+        # Slots free up at roughly max_concurrent / service_time per second
+        estimated_wait = (position + 1) * self._service_time / max(self.max_concurrent, 1)
+        return {
+            'queue_token': token,
+            'position': position + 1,
+            'queue_depth': len(self._queue),
+            'estimated_wait': round(estimated_wait, 2),
+            'retry_after': max(1, int(estimated_wait + 0.999))
+        }
+
+    def try_admit(self, token=None):
+        """
+        Try to take a slot.
+
+        Returns (True, None) when admitted - the caller must call release().
+        Otherwise returns (False, ticket) where ticket is None if the waiting
+        room is full, or a dict describing the caller's place in line.
+        """
+        with self._lock:
+            now = self.clock()
+            self._expire(now)
+
+            if token is not None and token in self._queue:
+                position = list(self._queue).index(token)
+                free_slots = self.max_concurrent - self._active
+                if position < free_slots:
+                    del self._queue[token]
+                    self._active += 1
+                    self._admitted_total += 1
+                    return True, None
+                self._queue[token] = now
+                return False, self._ticket(token, position)
+
+            # New arrivals only skip the line when nobody is waiting
+            if not self._queue and self._active < self.max_concurrent:
+                self._active += 1
+                self._admitted_total += 1
+                return True, None
+
+            if len(self._queue) >= self.max_queue:
+                self._rejected_total += 1
+                return False, None
+
+            token = uuid.uuid4().hex
+            self._queue[token] = now
+            self._queued_total += 1
+            return False, self._ticket(token, len(self._queue) - 1)
+
+    def release(self, started_at=None):
+        """Give back a slot and fold its hold time into the wait estimate"""
+        with self._lock:
+            self._active = max(0, self._active - 1)
+            if started_at is not None:
+                elapsed = self.clock() - started_at
+                self._service_time = 0.8 * self._service_time + 0.2 * elapsed
+
+    def position(self, token):
+        """Return the ticket for a queued token, or None if it is unknown"""
+        with self._lock:
+            self._expire(self.clock())
+            if token not in self._queue:
+                return None
+            return self._ticket(token, list(self._queue).index(token))
+
+    def status(self):
+        """Snapshot of live queue depth and counters"""
+        with self._lock:
+            self._expire(self.clock())
+            return {
+                'name': self.name,
+                'active': self._active,
+                'capacity': self.max_concurrent,
+                'queue_depth': len(self._queue),
+                'max_queue': self.max_queue,
+                'avg_service_time': round(self._service_time, 4),
+                'admitted_total': self._admitted_total,
+                'queued_total': self._queued_total,
+                'rejected_total': self._rejected_total,
+                'expired_total': self._expired_total
+            }
+
+
+def admission_required(name):
+    """Decorator that runs the view only once the named controller admits it"""
+    def decorator(view):
+        @wraps(view)
+        def wrapped(*args, **kwargs):
+            controller = current_app.extensions[f'{name}_admission']
+            token = request.headers.get('X-Queue-Token') or request.args.get('queue_token')
+            admitted, ticket = controller.try_admit(token)
+
+            if not admitted:
+                if ticket is None:
+                    response = jsonify({
+                        'success': False,
+                        'queued': False,
+                        'message': 'Too many requests are waiting. Please try again later.'
+                    })
+                    response.headers['Retry-After'] = str(controller.token_ttl)
+                    return response, 503
+
+                response = jsonify({
+                    'success': False,
+                    'queued': True,
+                    'message': 'High demand right now. You are in the queue.',
+                    **ticket
+                })
+                response.headers['Retry-After'] = str(ticket['retry_after'])
+                return response, 503
+
+            started_at = controller.clock()
+            try:
+                return view(*args, **kwargs)
+            finally:
+                controller.release(started_at)
+        return wrapped
+    return decorator
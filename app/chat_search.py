@@ -0,0 +1,132 @@
+"""
+Full-text search over chat transcripts
+
+SQLite uses an external-content FTS5 table kept in sync by triggers on
+chat_messages; PostgreSQL uses a generated tsvector column with a GIN index.
+Both are maintained by the database on every insert (including the batched
+inserts from the chat writer), so the index never needs a full rebuild.
+Other databases fall back to LIKE.
+"""
+
+import re
+from datetime import datetime
+
+from sqlalchemy import and_, event, or_, text
+
+SQLITE_DDL = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS chat_messages_fts USING fts5(
+        message, username, content='chat_messages', content_rowid='id'
+    )""",
+    """CREATE TRIGGER IF NOT EXISTS chat_messages_fts_insert AFTER INSERT ON chat_messages BEGIN
+        INSERT INTO chat_messages_fts(rowid, message, username) VALUES (new.id, new.message, new.username);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_messages_fts_delete AFTER DELETE ON chat_messages BEGIN
+        INSERT INTO chat_messages_fts(chat_messages_fts, rowid, message, username)
+        VALUES ('delete', old.id, old.message, old.username);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS chat_messages_fts_update AFTER UPDATE OF message, username ON chat_messages BEGIN
+        INSERT INTO chat_messages_fts(chat_messages_fts, rowid, message, username)
+        VALUES ('delete', old.id, old.message, old.username);
+        INSERT INTO chat_messages_fts(rowid, message, username) VALUES (new.id, new.message, new.username);
+    END""",
+]
+
+POSTGRES_DDL = [
+    """ALTER TABLE chat_messages ADD COLUMN IF NOT EXISTS search_vector tsvector
+        GENERATED ALWAYS AS (
+            to_tsvector('english', coalesce(message, '') || ' ' || coalesce(username, ''))
+        ) STORED""",
+    "CREATE INDEX IF NOT EXISTS ix_chat_messages_search ON chat_messages USING GIN (search_vector)",
+]
+
+
+def ensure_index(connection):
+    """Create the full-text index for this connection's database if missing"""
+    dialect = connection.dialect.name
+    if dialect == 'sqlite':
+        existed = connection.execute(text(
+            "SELECT 1 FROM sqlite_master WHERE name = 'chat_messages_fts'"
+        )).first()
+        for statement in SQLITE_DDL:
+            connection.execute(text(statement))
+        if not existed:
+            # Index whatever was written before the FTS table existed
+            connection.execute(text("INSERT INTO chat_messages_fts(chat_messages_fts) VALUES ('rebuild')"))
+    elif dialect == 'postgresql':
+        for statement in POSTGRES_DDL:
+            connection.execute(text(statement))
+
+
+def drop_index(connection):
+    """Drop the SQLite FTS table along with chat_messages"""
+    if connection.dialect.name == 'sqlite':
+        connection.execute(text("DROP TABLE IF EXISTS chat_messages_fts"))
+
+
+def register(table):
+    """Keep the index in step with create_all()/drop_all() of chat_messages"""
+    event.listen(table, 'after_create', lambda target, connection, **kw: ensure_index(connection))
+    event.listen(table, 'before_drop', lambda target, connection, **kw: drop_index(connection))
+
+
+def fts5_query(search):
+    """
+    Turn free text into a safe FTS5 expression: every word must appear,
+    and a trailing * keeps prefix matching (refund* -> refunded).
+    """
+    terms = []
+    for word, star in re.findall(r'(\w+)(\*?)', search):
+        terms.append(f'"{word}"{star}')
+    return ' '.join(terms)
+
+
+def search_messages(search, start=None, end=None, is_support=None, cursor=None, limit=20):
+    """
+    Return (messages, next_cursor) matching search, newest first.
+
+    start/end bound the timestamp, is_support filters by sender type and
+    cursor continues from the last message of a previous page.
+    """
+    from app import db
+    from app.models import ChatMessage
+
+    dialect = db.session.get_bind().dialect.name
+    query = ChatMessage.query
+
+    if dialect == 'sqlite':
+        match = fts5_query(search)
+        if not match:
+            return [], None
+        query = query.filter(text(
+            "chat_messages.id IN (SELECT rowid FROM chat_messages_fts WHERE chat_messages_fts MATCH :match)"
+        ).bindparams(match=match))
+    elif dialect == 'postgresql':
+        query = query.filter(text(
+            "chat_messages.search_vector @@ websearch_to_tsquery('english', :search)"
+        ).bindparams(search=search))
+    else:
+        pattern = f'%{search}%'
+        query = query.filter(or_(ChatMessage.message.ilike(pattern), ChatMessage.username.ilike(pattern)))
+
+    if start is not None:
+        query = query.filter(ChatMessage.timestamp >= start)
+    if end is not None:
+        query = query.filter(ChatMessage.timestamp < end)
+    if is_support is not None:
+        query = query.filter(ChatMessage.is_support == is_support)
+
+    if cursor:
+        timestamp, message_id = cursor.rsplit('_', 1)
+        timestamp = datetime.fromisoformat(timestamp)
+        query = query.filter(or_(
+            ChatMessage.timestamp < timestamp,
+            and_(ChatMessage.timestamp == timestamp, ChatMessage.id < int(message_id))
+        ))
+
+    rows = query.order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(limit + 1).all()
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = f'{rows[-1].timestamp.isoformat()}_{rows[-1].id}'
+
+    return [row.to_dict() for row in rows], next_cursor
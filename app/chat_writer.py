@@ -0,0 +1,127 @@
+"""
+Write-behind persistence for chat messages
+
+Handlers broadcast a message as soon as it arrives and hand the row to the
+writer, which inserts buffered rows in a single batch every N messages or M
+milliseconds, whichever comes first.
+"""
+
+import atexit
+import logging
+import threading
+
+logger = logging.getLogger(__name__)
+
+
+class ChatWriter:
+    """Buffered, batched inserts into chat_messages"""
+
+    def __init__(self, socketio, app=None):
+        self.socketio = socketio
+        self.app = None
+        self.enabled = True
+        self.batch_size = 100
+        self.flush_interval = 0.2
+        self.max_buffer = 5000
+        self._lock = threading.Lock()
+        self._buffer = []
+        self._flusher_started = False
+        self._shutdown_hook = False
+        self._stats = {'submitted': 0, 'flushed': 0, 'batches': 0, 'inline_flushes': 0, 'errors': 0}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read batching options from the app config"""
+        # Anything buffered for a previous app belongs to its database
+        if self.app is not None:
+            self.flush()
+            self._buffer = []
+        self._stats = dict.fromkeys(self._stats, 0)
+        self.app = app
+        self.enabled = app.config['CHAT_WRITE_BEHIND']
+        self.batch_size = app.config['CHAT_WRITER_BATCH_SIZE']
+        self.flush_interval = app.config['CHAT_WRITER_FLUSH_INTERVAL_MS'] / 1000.0
+        self.max_buffer = app.config['CHAT_WRITER_MAX_BUFFER']
+        if app.config['CHAT_WRITER_FLUSH_ON_SHUTDOWN'] and not self._shutdown_hook:
+            atexit.register(self.flush)
+            self._shutdown_hook = True
+        app.extensions['chat_writer'] = self
+
+    def submit(self, row):
+        """
+        Queue a chat_messages row (a dict of column values) for insertion.
+
+        When write-behind is disabled the row is written immediately. When the
+        buffer is full the caller flushes inline, which slows producers down to
+        the speed of the database instead of growing memory without bound.
+        """
+        if not self.enabled:
+            self._write([row])
+            return
+
+        with self._lock:
+            self._buffer.append(row)
+            self._stats['submitted'] += 1
+            pending = len(self._buffer)
+
+        if pending >= self.max_buffer:
+            self._stats['inline_flushes'] += 1
+            self.flush()
+        elif pending >= self.batch_size:
+            self.flush()
+        else:
+            self._ensure_flusher()
+
+    def flush(self):
+        """Insert everything buffered so far; returns the number of rows written"""
+        with self._lock:
+            batch, self._buffer = self._buffer, []
+        if not batch:
+            return 0
+        return self._write(batch)
+
+    def pending(self):
+        """Number of buffered rows not yet in the database"""
+        with self._lock:
+            return len(self._buffer)
+
+    def stats(self):
+        """Counters for monitoring"""
+        with self._lock:
+            return dict(self._stats, pending=len(self._buffer))
+
+    def _write(self, batch):
+        from app import db
+        from app.models import ChatMessage
+
+        with self.app.app_context():
+            try:
+                db.session.execute(db.insert(ChatMessage), batch)
+                db.session.commit()
+            except Exception:
+                db.session.rollback()
+                self._stats['errors'] += 1
+                logger.exception('Failed to persist %d chat messages', len(batch))
+                # Put the rows back so the next flush retries them
+                with self._lock:
+                    self._buffer[:0] = batch[:max(0, self.max_buffer - len(self._buffer))]
+                return 0
+
+        self._stats['flushed'] += len(batch)
+        self._stats['batches'] += 1
+        return len(batch)
+
+    def _ensure_flusher(self):
+        with self._lock:
+            if self._flusher_started:
+                return
+            self._flusher_started = True
+        self.socketio.start_background_task(self._run)
+
+    def _run(self):
+        """Background loop that flushes on the time trigger"""
+        while True:
+            self.socketio.sleep(self.flush_interval)
+            if self.pending():
+                self.flush()
@@ -0,0 +1,176 @@
+"""
+Database connection pool configuration and monitoring
+
+Pool size, overflow, timeout, recycle and pre-ping come from the DB_POOL_*
+settings of each config class and are turned into SQLALCHEMY_ENGINE_OPTIONS
+(explicit SQLALCHEMY_ENGINE_OPTIONS entries still win). The pool records how
+long each checkout waited for a connection, so queuing for connections shows
+up in /metrics next to the in-use and overflow counts.
+
+psycopg2 talks to PostgreSQL in blocking C code, which would freeze every
+green thread on an eventlet worker. When the process is monkey-patched by
+eventlet, psycopg2 is switched to eventlet-aware waiting instead.
+"""
+
+import threading
+import time
+
+from sqlalchemy import exc
+from sqlalchemy.pool import QueuePool
+
+from app.metrics import Histogram, _labels, _number
+
+WAIT_BUCKETS = (0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0, 10.0, 30.0)
+
+
+class InstrumentedQueuePool(QueuePool):
+    """QueuePool that times checkouts and counts checkout timeouts"""
+
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self._stats_lock = threading.Lock()
+        self.wait = Histogram(WAIT_BUCKETS)
+        self.timeouts = 0
+
+    def _do_get(self):
+        started = time.perf_counter()
+        try:
+            return super()._do_get()
+        except exc.TimeoutError:
+            with self._stats_lock:
+                self.timeouts += 1
+            raise
+        finally:
+            waited = time.perf_counter() - started
+            with self._stats_lock:
+                self.wait.observe(waited)
+
+    def pool_stats(self):
+        """Size, in-use and overflow counts plus checkout wait percentiles"""
+        with self._stats_lock:
+            capacity = self.size() + self._max_overflow
+            checked_out = self.checkedout()
+            return {
+                'size': self.size(),
+                'max_overflow': self._max_overflow,
+                'checked_out': checked_out,
+                'checked_in': self.checkedin(),
+                'overflow': max(0, self.overflow()),
+                'saturation': round(checked_out / capacity, 3) if capacity > 0 else 0,
+                'checkouts': self.wait.count,
+                'timeouts': self.timeouts,
+                'wait_p50': round(self.wait.quantile(0.50), 6),
+                'wait_p95': round(self.wait.quantile(0.95), 6),
+                'wait_p99': round(self.wait.quantile(0.99), 6)
+            }
+
+
+def is_memory_sqlite(uri):
+    return uri.startswith('sqlite') and (':memory:' in uri or uri.split('?')[0] in ('sqlite://', 'sqlite:///'))
+
+
+def engine_options(config):
+    """SQLALCHEMY_ENGINE_OPTIONS built from the DB_POOL_* settings"""
+    options = {}
+    if not is_memory_sqlite(config['SQLALCHEMY_DATABASE_URI']):
+        # An in-memory SQLite database lives in a single connection; no pool to size
+        options = {
+            'poolclass': InstrumentedQueuePool,
+            'pool_size': config['DB_POOL_SIZE'],
+            'max_overflow': config['DB_MAX_OVERFLOW'],
+            'pool_timeout': config['DB_POOL_TIMEOUT'],
+            'pool_recycle': config['DB_POOL_RECYCLE'],
+            'pool_pre_ping': config['DB_POOL_PRE_PING']
+        }
+    options.update(config.get('SQLALCHEMY_ENGINE_OPTIONS') or {})
+    return options
+
+
+def patch_psycopg2_for_eventlet():
+    """Make psycopg2 yield to the eventlet hub while it waits on the server"""
+    import psycopg2
+    from psycopg2 import extensions
+    from eventlet.hubs import trampoline
+
+    def wait(conn, timeout=None):
+        while True:
+            state = conn.poll()
+            if state == extensions.POLL_OK:
+                return
+            if state == extensions.POLL_READ:
+                trampoline(conn.fileno(), read=True)
+            elif state == extensions.POLL_WRITE:
+                trampoline(conn.fileno(), write=True)
+            else:
+                raise psycopg2.OperationalError(f'Bad result from poll: {state!r}')
+
+    extensions.set_wait_callback(wait)
+
+
+def running_under_eventlet():
+    try:
+        from eventlet import patcher
+    except ImportError:
+        return False
+    return patcher.is_monkey_patched('socket')
+
+
+class PoolMonitor:
+    """Applies pool settings to the app and reports pool health"""
+
+    def __init__(self, metrics=None, app=None):
+        self.metrics = metrics
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Must run before db.init_app() so the engine picks up the options"""
+        app.config['SQLALCHEMY_ENGINE_OPTIONS'] = engine_options(app.config)
+        uri = app.config['SQLALCHEMY_DATABASE_URI']
+        if (app.config['DB_EVENTLET_PSYCOPG2'] and uri.startswith(('postgresql://', 'postgresql+psycopg2://'))
+                and running_under_eventlet()):
+            patch_psycopg2_for_eventlet()
+        if self.metrics is not None:
+            self.metrics.register_collector('db_pool', self)
+        app.extensions['pool_monitor'] = self
+
+    def stats(self):
+        """Pool stats for the current app's engine"""
+        from app import db
+        pool = db.engine.pool
+        if not hasattr(pool, 'pool_stats'):
+            return {'pool': type(pool).__name__}
+        return dict(pool.pool_stats(), pool=type(pool).__name__)
+
+    def render_metrics(self):
+        """Prometheus lines for /metrics"""
+        from app import db
+        pool = db.engine.pool
+        if not hasattr(pool, 'pool_stats'):
+            return []
+        stats = pool.pool_stats()
+        lines = []
+        for name, key, help_text in (
+            ('db_pool_size', 'size', 'Connections kept open by the pool.'),
+            ('db_pool_checked_out', 'checked_out', 'Connections currently in use.'),
+            ('db_pool_overflow', 'overflow', 'Connections open beyond the pool size.'),
+            ('db_pool_saturation', 'saturation', 'In-use connections over size plus max overflow.'),
+        ):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} gauge')
+            lines.append(f'{name} {_number(stats[key])}')
+        lines.append('# HELP db_pool_checkout_timeouts_total Checkouts that gave up waiting for a connection.')
+        lines.append('# TYPE db_pool_checkout_timeouts_total counter')
+        lines.append(f'db_pool_checkout_timeouts_total {stats["timeouts"]}')
+
+        lines.append('# HELP db_pool_checkout_wait_seconds Time spent waiting for a pooled connection.')
+        lines.append('# TYPE db_pool_checkout_wait_seconds histogram')
+        with pool._stats_lock:
+            cumulative = 0
+            for bound, count in zip(WAIT_BUCKETS + ('+Inf',), pool.wait.counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(float(bound))
+                lines.append(f'db_pool_checkout_wait_seconds_bucket{_labels(le=le)} {cumulative}')
+            lines.append(f'db_pool_checkout_wait_seconds_sum {_number(pool.wait.total)}')
+            lines.append(f'db_pool_checkout_wait_seconds_count {pool.wait.count}')
+        return lines
@@ -0,0 +1,178 @@
+"""
+Identity cache for Flask-Login's user_loader
+
+Every authenticated request loads the signed-in user. The cache keeps each
+user's profile columns for a short TTL so that lookup costs no query; the
+User is rebuilt from the cached row and attached to the session without a
+SELECT. The password hash is never cached: it loads on first access, which
+only login needs.
+
+The memory backend is a bounded LRU for this process. The redis backend
+shares entries across nodes, so invalidating after a profile change or a
+logout takes effect everywhere at once.
+"""
+
+import json
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+
+from sqlalchemy.orm import make_transient_to_detached
+
+from app.redis_client import get_redis
+
+CACHED_COLUMNS = ('id', 'username', 'email', 'full_name', 'phone', 'address', 'created_at')
+
+
+class MemoryIdentityBackend:
+    """Bounded LRU with per-entry expiry, for a single process"""
+
+    def __init__(self, max_size=10000, clock=time.monotonic):
+        self.max_size = max_size
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()  # user_id -> (expires_at, row)
+
+    def get(self, user_id):
+        with self._lock:
+            entry = self._entries.get(user_id)
+            if entry is None:
+                return None
+            if entry[0] <= self.clock():
+                del self._entries[user_id]
+                return None
+            self._entries.move_to_end(user_id)
+            return entry[1]
+
+    def set(self, user_id, row, ttl):
+        with self._lock:
+            self._entries[user_id] = (self.clock() + ttl, row)
+            self._entries.move_to_end(user_id)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+
+    def delete(self, user_id):
+        with self._lock:
+            return self._entries.pop(user_id, None) is not None
+
+    def size(self):
+        with self._lock:
+            return len(self._entries)
+
+
+class RedisIdentityBackend:
+    """Entries shared through Redis (or a memory:// LocalRedis stand-in)"""
+
+    def __init__(self, client, prefix='identity'):
+        self.redis = client
+        self.prefix = prefix
+
+    def _key(self, user_id):
+        return f'{self.prefix}:{user_id}'
+
+    def get(self, user_id):
+        value = self.redis.get(self._key(user_id))
+        return json.loads(value) if value else None
+
+    def set(self, user_id, row, ttl):
+        self.redis.set(self._key(user_id), json.dumps(row), px=int(ttl * 1000))
+
+    def delete(self, user_id):
+        return bool(self.redis.delete(self._key(user_id)))
+
+    def size(self):
+        return sum(1 for _ in self.redis.scan_iter(match=f'{self.prefix}:*'))
+
+
+class IdentityCache:
+    """Short-TTL cache of signed-in users, configured from the app config"""
+
+    def __init__(self, app=None):
+        self.backend = MemoryIdentityBackend()
+        self.ttl = 60
+        self._lock = threading.Lock()
+        self.reset_stats()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Pick the backend and start with empty counters"""
+        self.ttl = app.config['IDENTITY_CACHE_TTL']
+        if app.config['IDENTITY_CACHE_BACKEND'] == 'redis':
+            client = get_redis(app.config['IDENTITY_CACHE_REDIS_URL'])
+            self.backend = RedisIdentityBackend(client)
+        else:
+            self.backend = MemoryIdentityBackend(app.config['IDENTITY_CACHE_MAX_SIZE'])
+        self.reset_stats()
+        app.extensions['identity_cache'] = self
+
+    def reset_stats(self):
+        with self._lock:
+            self._stats = {'hits': 0, 'misses': 0, 'invalidations': 0}
+
+    def _count(self, name):
+        with self._lock:
+            self._stats[name] += 1
+
+    def load(self, user_id):
+        """Return the User for user_id, from the cache when possible"""
+        from app import db
+        from app.models import User
+
+        if self.ttl <= 0:
+            return db.session.get(User, user_id)
+
+        row = self.backend.get(user_id)
+        if row is not None:
+            self._count('hits')
+            return self._attach(row)
+
+        self._count('misses')
+        user = db.session.get(User, user_id)
+        if user is not None:
+            self.store(user)
+        return user
+
+    def store(self, user):
+        """Cache user's profile columns (e.g. right after login)"""
+        if self.ttl <= 0:
+            return
+        row = {name: getattr(user, name) for name in CACHED_COLUMNS}
+        if row['created_at'] is not None:
+            row['created_at'] = row['created_at'].isoformat()
+        self.backend.set(user.id, row, self.ttl)
+
+    def invalidate(self, user_id):
+        """Drop user_id so the next request reloads it from the database"""
+        self._count('invalidations')
+        self.backend.delete(user_id)
+
+    def _attach(self, row):
+        """Rebuild a persistent User from a cached row without a SELECT"""
+        from app import db
+        from app.models import User
+
+        existing = db.session.identity_map.get(db.session.identity_key(User, row['id']))
+        if existing is not None:
+            return existing
+
+        user = User()
+        for name in CACHED_COLUMNS:
+            setattr(user, name, row[name])
+        if user.created_at is not None:
+            user.created_at = datetime.fromisoformat(user.created_at)
+        # Mark as loaded-from-database; password_hash stays unloaded until used
+        make_transient_to_detached(user)
+        db.session.add(user)
+        return user
+
+    def stats(self):
+        """Hit/miss counters and hit ratio for this process"""
+        with self._lock:
+            stats = dict(self._stats)
+        lookups = stats['hits'] + stats['misses']
+        stats['hit_ratio'] = round(stats['hits'] / lookups, 3) if lookups else 0
+        stats['size'] = self.backend.size()
+        stats['ttl'] = self.ttl
+        return stats
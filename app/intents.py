@@ -0,0 +1,254 @@
+"""
+Support bot intent engine
+
+Intent rules (keywords -> canned response) come from an optional JSON file
+(CHAT_INTENTS_FILE) or the built-in defaults, with rows in the chat_intents
+table overriding, adding or disabling rules by name. All keywords are compiled into a single word-boundary regex so a
+message is scanned once and the highest-priority matching intent wins.
+"""
+
+import json
+import os
+import re
+import threading
+import time
+
+from flask import has_app_context
+
+FALLBACK_RESPONSE = (
+    "Thank you for your message! A support representative will assist you shortly. "
+    "Meanwhile, you can explore our Help Center for quick answers."
+)
+
+# A trailing * on a keyword matches any word starting with it (ship* -> shipping)
+DEFAULT_INTENTS = [
+    {
+        'name': 'greeting',
+        'priority': 100,
+        'keywords': ['hello', 'hi', 'hey', 'greetings'],
+        'response': "Hello! Welcome to E-Shop support. How can I assist you today?"
+    },
+    {
+        'name': 'order_tracking',
+        'priority': 90,
+        'keywords': ['order*', 'track*', 'delivery'],
+        'response': "To track your order, please go to 'My Orders' in your account dashboard. You can view the status and tracking information there."
+    },
+    {
+        'name': 'returns',
+        'priority': 80,
+        'keywords': ['return*', 'refund*', 'exchange*'],
+        'response': "We accept returns within 30 days of delivery. Please visit our Returns page for more information, or contact support@eshop.com for assistance."
+    },
+    {
+        'name': 'payment',
+        'priority': 70,
+        'keywords': ['payment*', 'pay', 'paid', 'checkout'],
+        'response': "We accept various payment methods including credit cards, debit cards, and digital wallets. All transactions are secure and encrypted."
+    },
+    {
+        'name': 'shipping',
+        'priority': 60,
+        'keywords': ['ship*'],
+        'response': "We offer free shipping on orders over $50. Standard delivery takes 3-5 business days. Express shipping is also available."
+    },
+    {
+        'name': 'availability',
+        'priority': 50,
+        'keywords': ['product*', 'item*', 'stock', 'available', 'availability'],
+        'response': "You can check product availability on each product page. If an item is out of stock, you can sign up for restock notifications."
+    },
+    {
+        'name': 'cancellation',
+        'priority': 40,
+        'keywords': ['cancel*'],
+        'response': "Orders can be cancelled within 1 hour of placement. After that, please contact our support team for assistance."
+    },
+    {
+        'name': 'promotions',
+        'priority': 30,
+        'keywords': ['discount*', 'coupon*', 'promo*', 'offer*', 'deal*'],
+        'response': "Check our Deals section for current promotions! Sign up for our newsletter to receive exclusive discount codes."
+    },
+    {
+        'name': 'help',
+        'priority': 20,
+        'keywords': ['help', 'support', 'assistance'],
+        'response': "I'm here to help! You can ask me about orders, shipping, returns, payments, or any other questions about our store."
+    },
+    {
+        'name': 'thanks',
+        'priority': 10,
+        'keywords': ['thank*', 'thx'],
+        'response': "You're welcome! Is there anything else I can help you with?"
+    }
+]
+
+
+def _trie_regex(node):
+    """
+    Turn a character trie into a regex with shared prefixes factored out,
+    so the engine rejects a non-keyword position after one character test.
+    """
+    is_end = node.get('')
+    if is_end:
+        # A wildcard keyword already matches every longer word below it
+        return r'\w*'
+
+    branches = [re.escape(char) + _trie_regex(child) for char, child in sorted(node.items()) if char]
+    if not branches:
+        return ''
+    body = branches[0] if len(branches) == 1 else '(?:' + '|'.join(branches) + ')'
+    # is_end is False (not None) when a keyword ends here but longer ones continue
+    return f'(?:{body})?' if is_end is False else body
+
+
+class CompiledIntents:
+    """All intent keywords compiled into one trie-shaped regex"""
+
+    def __init__(self, intents):
+        self.intents = sorted(intents, key=lambda i: i['priority'], reverse=True)
+        self.exact = {}
+        self.prefixes = {}
+
+        # Walk lowest priority first so higher priorities overwrite shared keywords
+        for intent in reversed(self.intents):
+            for keyword in intent['keywords']:
+                keyword = keyword.strip().lower()
+                if keyword.endswith('*') and len(keyword) > 1:
+                    self.prefixes[keyword[:-1]] = intent
+                elif keyword:
+                    self.exact[keyword] = intent
+
+        self.pattern = None
+        if self.exact or self.prefixes:
+            trie = {}
+            for keyword in list(self.exact) + list(self.prefixes):
+                node = trie
+                for char in keyword:
+                    node = node.setdefault(char, {})
+                node[''] = keyword in self.prefixes
+            self.pattern = re.compile(r'\b(?:' + _trie_regex(trie) + r')\b', re.IGNORECASE)
+
+    def _resolve(self, word):
+        """Map a matched word back to its rule"""
+        word = word.lower()
+        intent = self.exact.get(word)
+        if intent is not None:
+            return intent
+        for end in range(len(word), 0, -1):
+            intent = self.prefixes.get(word[:end])
+            if intent is not None:
+                return intent
+        return None
+
+    def match(self, message):
+        """Return the highest-priority intent mentioned in message, or None"""
+        if self.pattern is None:
+            return None
+        best = None
+        for found in self.pattern.finditer(message):
+            intent = self._resolve(found.group(0))
+            if intent is not None and (best is None or intent['priority'] > best['priority']):
+                best = intent
+        return best
+
+
+class IntentEngine:
+    """Loads intent rules, keeps them compiled and hot-reloads on change"""
+
+    def __init__(self, app=None):
+        self.rules_file = None
+        self.reload_interval = 30
+        self._lock = threading.Lock()
+        self._compiled = CompiledIntents(DEFAULT_INTENTS)
+        self._signature = None
+        self._source = 'defaults'
+        self._checked_at = 0.0
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read the rule source options from the app config"""
+        self.rules_file = app.config.get('CHAT_INTENTS_FILE')
+        self.reload_interval = app.config.get('CHAT_INTENTS_RELOAD_INTERVAL', self.reload_interval)
+        self._signature = None
+        self._checked_at = 0.0
+        app.extensions['intent_engine'] = self
+
+    def respond(self, message):
+        """Canned response for a customer message"""
+        intent = self.match(message)
+        return intent['response'] if intent else FALLBACK_RESPONSE
+
+    def match(self, message):
+        """Highest-priority intent for message, or None"""
+        self._maybe_reload()
+        return self._compiled.match(message)
+
+    def reload(self):
+        """Force the rules to be read and compiled again"""
+        self._signature = None
+        self._checked_at = 0.0
+        self._maybe_reload()
+
+    @property
+    def source(self):
+        return self._source
+
+    def intents(self):
+        """Currently active rules, highest priority first"""
+        self._maybe_reload()
+        return list(self._compiled.intents)
+
+    def _maybe_reload(self):
+        now = time.monotonic()
+        if self._signature is not None and now - self._checked_at < self.reload_interval:
+            return
+        with self._lock:
+            self._checked_at = now
+            signature = self._current_signature()
+            if signature == self._signature:
+                return
+            intents, source = self._load()
+            self._compiled = CompiledIntents(intents)
+            self._source = source
+            self._signature = signature
+
+    def _current_signature(self):
+        """Cheap fingerprint of every rule source, used to detect edits"""
+        db_signature = None
+        if has_app_context():
+            from app import db
+            from app.models import ChatIntent
+            db_signature = tuple(db.session.query(
+                db.func.count(ChatIntent.id), db.func.max(ChatIntent.updated_at)
+            ).one())
+
+        file_signature = None
+        if self.rules_file and os.path.exists(self.rules_file):
+            file_signature = os.path.getmtime(self.rules_file)
+
+        return (db_signature, file_signature)
+
+    def _load(self):
+        """Return (intents, source description) with database rules layered on top"""
+        if self.rules_file and os.path.exists(self.rules_file):
+            with open(self.rules_file) as f:
+                base, source = json.load(f), 'file'
+        else:
+            base, source = DEFAULT_INTENTS, 'defaults'
+
+        rules = {intent['name']: intent for intent in base}
+        if has_app_context():
+            from app.models import ChatIntent
+            rows = ChatIntent.query.all()
+            for row in rows:
+                if row.is_active:
+                    rules[row.name] = row.to_rule()
+                else:
+                    rules.pop(row.name, None)
+            if rows:
+                source += '+database'
+
+        return list(rules.values()), source
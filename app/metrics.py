@@ -0,0 +1,260 @@
+"""
+Request and Socket.IO instrumentation
+
+Every HTTP request is counted per blueprint, endpoint, method and status and
+its latency goes into a fixed-bucket histogram per endpoint; every Socket.IO
+event is counted and timed per event name. Recording is a lock, a dict lookup
+and a bisect, so it can stay on in production.
+
+render() produces the Prometheus text format for /metrics. Percentiles
+(p50/p95/p99) are estimated from the buckets the same way Prometheus'
+histogram_quantile() does. Numbers are per process.
+"""
+
+import bisect
+import threading
+import time
+from functools import wraps
+
+from flask import g, request
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+QUERY_COUNT_BUCKETS = (1, 2, 3, 5, 10, 20, 50, 100)
+
+
+class Histogram:
+    """Cumulative-style latency histogram with fixed upper bounds"""
+
+    __slots__ = ('bounds', 'counts', 'total', 'count')
+
+    def __init__(self, bounds):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)  # last slot is +Inf
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        self.counts[bisect.bisect_left(self.bounds, value)] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate the q-quantile by interpolating inside its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        cumulative = 0
+        for i, count in enumerate(self.counts):
+            if cumulative + count >= rank and count:
+                if i == len(self.bounds):
+                    return self.bounds[-1]
+                lower = self.bounds[i - 1] if i else 0.0
+                return lower + (self.bounds[i] - lower) * (rank - cumulative) / count
+            cumulative += count
+        return self.bounds[-1]
+
+
+def _labels(**labels):
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + '}'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Metrics:
+    """Per-endpoint and per-event counters and latency histograms"""
+
+    def __init__(self, app=None, buckets=DEFAULT_BUCKETS):
+        self.enabled = True
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._collectors = {}  # name -> object with stats() and render_metrics()
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Hook request timing into the app"""
+        self.enabled = app.config['METRICS_ENABLED']
+        self.buckets = tuple(app.config['METRICS_BUCKETS'])
+        self.reset()
+        if self.enabled:
+            app.before_request(self._start_timer)
+            app.after_request(self._record_request)
+        app.extensions['metrics'] = self
+
+    def reset(self):
+        with self._lock:
+            self._requests = {}         # (blueprint, endpoint, method, status) -> count
+            self._latency = {}          # (blueprint, endpoint) -> Histogram
+            self._events = {}           # (event, outcome) -> count
+            self._event_latency = {}    # event -> Histogram
+            self._queries = {}          # (blueprint, endpoint) -> Histogram of queries per request
+            self._query_seconds = {}    # (blueprint, endpoint) -> total DB seconds
+            self._n_plus_one = {}       # (blueprint, endpoint) -> requests flagged
+
+    # -- HTTP ----------------------------------------------------------------
+
+    def _start_timer(self):
+        g._metrics_started = time.perf_counter()
+
+    def _record_request(self, response):
+        started = g.pop('_metrics_started', None)
+        if started is not None:
+            endpoint = request.endpoint or 'unmatched'  # not the path: keeps label cardinality bounded
+            self.observe_request(request.blueprint or '', endpoint, request.method,
+                                 response.status_code, time.perf_counter() - started)
+        return response
+
+    def observe_request(self, blueprint, endpoint, method, status, duration):
+        with self._lock:
+            key = (blueprint, endpoint, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            histogram = self._latency.get((blueprint, endpoint))
+            if histogram is None:
+                histogram = self._latency[(blueprint, endpoint)] = Histogram(self.buckets)
+            histogram.observe(duration)
+
+    def observe_queries(self, blueprint, endpoint, count, seconds, n_plus_one):
+        """Record one request's SQL query count and DB time"""
+        key = (blueprint, endpoint)
+        with self._lock:
+            histogram = self._queries.get(key)
+            if histogram is None:
+                histogram = self._queries[key] = Histogram(QUERY_COUNT_BUCKETS)
+            histogram.observe(count)
+            self._query_seconds[key] = self._query_seconds.get(key, 0.0) + seconds
+            if n_plus_one:
+                self._n_plus_one[key] = self._n_plus_one.get(key, 0) + 1
+
+    def register_collector(self, name, collector):
+        """Report collector.stats() and collector.render_metrics() alongside ours"""
+        self._collectors[name] = collector
+
+    # -- Socket.IO -----------------------------------------------------------
+
+    def observe_event(self, event, outcome, duration):
+        with self._lock:
+            self._events[(event, outcome)] = self._events.get((event, outcome), 0) + 1
+            histogram = self._event_latency.get(event)
+            if histogram is None:
+                histogram = self._event_latency[event] = Histogram(self.buckets)
+            histogram.observe(duration)
+
+    def instrument_socketio(self, socketio):
+        """Time every handler registered with socketio.on() so far"""
+        for i, (event, handler, namespace) in enumerate(socketio.handlers):
+            if not getattr(handler, '_metrics_wrapped', False):
+                socketio.handlers[i] = (event, self._wrap_event(event, handler), namespace)
+
+    def _wrap_event(self, event, handler):
+        @wraps(handler)
+        def wrapped(*args):
+            if not self.enabled:
+                return handler(*args)
+            started = time.perf_counter()
+            outcome = 'error'
+            try:
+                result = handler(*args)
+                outcome = 'ok'
+                return result
+            finally:
+                self.observe_event(event, outcome, time.perf_counter() - started)
+        wrapped._metrics_wrapped = True
+        return wrapped
+
+    # -- reporting -------------------------------------------------------------
+
+    def summary(self):
+        """Counts and p50/p95/p99 latency (seconds) per endpoint and event"""
+        with self._lock:
+            endpoints = {}
+            for (blueprint, endpoint, method, status), count in self._requests.items():
+                entry = endpoints.setdefault(endpoint, {'blueprint': blueprint, 'count': 0, 'status': {}})
+                entry['count'] += count
+                entry['status'][str(status)] = entry['status'].get(str(status), 0) + count
+            for (blueprint, endpoint), histogram in self._latency.items():
+                endpoints[endpoint].update(self._percentiles(histogram))
+            for (blueprint, endpoint), histogram in self._queries.items():
+                endpoints.setdefault(endpoint, {'blueprint': blueprint, 'count': 0, 'status': {}})['db_queries'] = {
+                    'p50': round(histogram.quantile(0.50), 1),
+                    'p95': round(histogram.quantile(0.95), 1),
+                    'seconds': round(self._query_seconds[(blueprint, endpoint)], 6),
+                    'suspected_n_plus_one': self._n_plus_one.get((blueprint, endpoint), 0)
+                }
+
+            events = {}
+            for (event, outcome), count in self._events.items():
+                entry = events.setdefault(event, {'count': 0, 'errors': 0})
+                entry['count'] += count
+                if outcome == 'error':
+                    entry['errors'] += count
+            for event, histogram in self._event_latency.items():
+                events[event].update(self._percentiles(histogram))
+        summary = {'endpoints': endpoints, 'socketio_events': events}
+        for name, collector in self._collectors.items():
+            summary[name] = collector.stats()
+        return summary
+
+    def _percentiles(self, histogram):
+        return {
+            'p50': round(histogram.quantile(0.50), 6),
+            'p95': round(histogram.quantile(0.95), 6),
+            'p99': round(histogram.quantile(0.99), 6)
+        }
+
+    def render(self):
+        """Everything in the Prometheus text exposition format"""
+        lines = []
+        with self._lock:
+            lines.append('# HELP http_requests_total HTTP requests by endpoint, method and status.')
+            lines.append('# TYPE http_requests_total counter')
+            for (blueprint, endpoint, method, status), count in sorted(self._requests.items()):
+                labels = _labels(blueprint=blueprint, endpoint=endpoint, method=method, status=status)
+                lines.append(f'http_requests_total{labels} {count}')
+
+            self._render_histogram(lines, 'http_request_duration_seconds', 'HTTP request latency.',
+                                   {(bp, ep): {'blueprint': bp, 'endpoint': ep} for bp, ep in self._latency},
+                                   self._latency)
+
+            endpoint_labels = {(bp, ep): {'blueprint': bp, 'endpoint': ep} for bp, ep in self._queries}
+            self._render_histogram(lines, 'db_queries_per_request', 'SQL queries run per HTTP request.',
+                                   endpoint_labels, self._queries, QUERY_COUNT_BUCKETS)
+            lines.append('# HELP db_query_seconds_total Time spent in SQL queries.')
+            lines.append('# TYPE db_query_seconds_total counter')
+            for key, seconds in sorted(self._query_seconds.items()):
+                lines.append(f'db_query_seconds_total{_labels(**endpoint_labels[key])} {_number(seconds)}')
+            lines.append('# HELP db_suspected_n_plus_one_total Requests that repeated one statement many times.')
+            lines.append('# TYPE db_suspected_n_plus_one_total counter')
+            for key, count in sorted(self._n_plus_one.items()):
+                lines.append(f'db_suspected_n_plus_one_total{_labels(**endpoint_labels[key])} {count}')
+
+            lines.append('# HELP socketio_events_total Socket.IO events handled, by outcome.')
+            lines.append('# TYPE socketio_events_total counter')
+            for (event, outcome), count in sorted(self._events.items()):
+                lines.append(f'socketio_events_total{_labels(event=event, outcome=outcome)} {count}')
+
+            self._render_histogram(lines, 'socketio_event_duration_seconds', 'Socket.IO handler duration.',
+                                   {event: {'event': event} for event in self._event_latency},
+                                   self._event_latency)
+        for collector in self._collectors.values():
+            lines.extend(collector.render_metrics())
+        return '\n'.join(lines) + '\n'
+
+    def _render_histogram(self, lines, name, help_text, labels_by_key, histograms, buckets=None):
+        lines.append(f'# HELP {name} {help_text}')
+        lines.append(f'# TYPE {name} histogram')
+        for key in sorted(histograms):
+            histogram, labels = histograms[key], labels_by_key[key]
+            cumulative = 0
+            for bound, count in zip((buckets or self.buckets) + ('+Inf',), histogram.counts):
+                cumulative += count
+                le = bound if bound == '+Inf' else _number(float(bound))
+                lines.append(f'{name}_bucket{_labels(**labels, le=le)} {cumulative}')
+            lines.append(f'{name}_sum{_labels(**labels)} {_number(histogram.total)}')
+            lines.append(f'{name}_count{_labels(**labels)} {histogram.count}')
@@ -1,7 +1,6 @@
 from datetime import datetime
-from app import db
+from app import db, chat_search, password_hasher
 from flask_login import UserMixin
-from werkzeug.security import generate_password_hash, check_password_hash
 
 class User(UserMixin, db.Model):
     """User model for authentication"""
@@ -22,12 +21,16 @@ class User(UserMixin, db.Model):
     orders = db.relationship('Order', backref='user', lazy=True)
     
     def set_password(self, password):
-        """Hash and set password"""
-        self.password_hash = generate_password_hash(password)
+        """Hash and set password (in the hashing pool, not on the event loop)"""
+        self.password_hash = password_hasher.hash(password)
     
     def check_password(self, password):
         """Verify password"""
-        return check_password_hash(self.password_hash, password)
+        return password_hasher.verify(self.password_hash, password)
+    
+    def password_needs_rehash(self):
+        """True if the stored hash predates the current hashing settings"""
+        return password_hasher.needs_rehash(self.password_hash)
     
     def to_dict(self):
         """Convert user to dictionary"""
@@ -162,6 +165,10 @@ class OrderItem(db.Model):
 class ChatMessage(db.Model):
     """Chat messages for customer support"""
     __tablename__ = 'chat_messages'
+    __table_args__ = (
+        # Serves "latest N messages for a session" and cursor paging backwards
+        db.Index('ix_chat_messages_session_timestamp', 'session_id', 'timestamp'),
+    )
     
     id = db.Column(db.Integer, primary_key=True)
     session_id = db.Column(db.String(100), nullable=False, index=True)
@@ -181,3 +188,33 @@ class ChatMessage(db.Model):
             'is_support': self.is_support,
             'timestamp': self.timestamp.isoformat()
         }
+
+
+# Full-text index over message/username, created and dropped with the table
+chat_search.register(ChatMessage.__table__)
+
+
+class ChatIntent(db.Model):
+    """Support bot intent rules (keywords -> canned response)"""
+    __tablename__ = 'chat_intents'
+    
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), unique=True, nullable=False)
+    keywords = db.Column(db.Text, nullable=False)  # Comma-separated, a trailing * matches word prefixes
+    response = db.Column(db.Text, nullable=False)
+    priority = db.Column(db.Integer, default=0)  # Highest priority wins when several intents match
+    is_active = db.Column(db.Boolean, default=True)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, onupdate=datetime.utcnow)
+    
+    def to_rule(self):
+        """Convert to the rule format used by the intent engine"""
+        return {
+            'name': self.name,
+            'priority': self.priority or 0,
+            'keywords': [k.strip() for k in self.keywords.split(',') if k.strip()],
+            'response': self.response
+        }
+    
+    def to_dict(self):
+        """Convert chat intent to dictionary"""
+        return dict(self.to_rule(), id=self.id, is_active=self.is_active)
@@ -0,0 +1,110 @@
+"""
+Password hashing off the event loop
+
+Hashing is deliberately slow (tens to hundreds of milliseconds of CPU). Run
+inline on an eventlet worker that would stall every other request and socket
+on the node, so hashes are computed in real OS threads: eventlet's tpool when
+Socket.IO runs on eventlet, otherwise a thread (or process) pool. hashlib
+releases the GIL while hashing, so threads do run in parallel.
+
+The algorithm and cost come from PASSWORD_HASH_METHOD, in Werkzeug's method
+syntax. Hashes made with older settings keep working, and needs_rehash()
+tells login to upgrade them.
+"""
+
+import concurrent.futures
+import threading
+
+from werkzeug.security import DEFAULT_PBKDF2_ITERATIONS, check_password_hash, generate_password_hash
+
+EXECUTORS = ('auto', 'tpool', 'thread', 'process', 'inline')
+
+
+def normalize_method(method):
+    """Fill in Werkzeug's defaults so methods compare equal to stored hashes"""
+    name, *params = method.split(':')
+    if name == 'pbkdf2':
+        digest = params[0] if params else 'sha256'
+        iterations = params[1] if len(params) > 1 else DEFAULT_PBKDF2_ITERATIONS
+        return f'pbkdf2:{digest}:{iterations}'
+    if name == 'scrypt':
+        n, r, p = (params + ['32768', '8', '1'][len(params):])[:3]
+        return f'scrypt:{n}:{r}:{p}'
+    return method
+
+
+class PasswordHasher:
+    """Hash and verify passwords in a worker pool, configured from the app config"""
+
+    def __init__(self, socketio=None, app=None):
+        self.socketio = socketio
+        self.method = normalize_method('scrypt')
+        self.executor = 'auto'
+        self.workers = 4
+        self._pool = None
+        self._slots = None
+        self._lock = threading.Lock()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read the hashing method and pool settings"""
+        executor = app.config['PASSWORD_HASH_EXECUTOR']
+        if executor not in EXECUTORS:
+            raise ValueError(f'PASSWORD_HASH_EXECUTOR must be one of {", ".join(EXECUTORS)}')
+        self.method = normalize_method(app.config['PASSWORD_HASH_METHOD'])
+        self.executor = executor
+        self.workers = app.config['PASSWORD_HASH_WORKERS']
+        self.shutdown()
+        app.extensions['password_hasher'] = self
+
+    def shutdown(self):
+        """Stop the thread/process pool, if one was started"""
+        with self._lock:
+            pool, self._pool = self._pool, None
+            self._slots = None
+        if pool is not None:
+            pool.shutdown(wait=False)
+
+    def _mode(self):
+        if self.executor != 'auto':
+            return self.executor
+        async_mode = getattr(self.socketio, 'async_mode', None)
+        return 'tpool' if async_mode == 'eventlet' else 'thread'
+
+    def _run(self, fn, *args):
+        mode = self._mode()
+        if mode == 'inline':
+            return fn(*args)
+        if mode == 'tpool':
+            from eventlet import tpool
+            from eventlet.semaphore import Semaphore
+            # Cap concurrent hashes so the hub keeps a share of the CPU
+            with self._lock:
+                if self._slots is None:
+                    self._slots = Semaphore(self.workers)
+                slots = self._slots
+            with slots:
+                return tpool.execute(fn, *args)
+
+        with self._lock:
+            if self._pool is None:
+                pool_class = (concurrent.futures.ProcessPoolExecutor if mode == 'process'
+                              else concurrent.futures.ThreadPoolExecutor)
+                self._pool = pool_class(max_workers=self.workers)
+            pool = self._pool
+        return pool.submit(fn, *args).result()
+
+    def hash(self, password):
+        """Hash password with the configured method"""
+        return self._run(generate_password_hash, password, self.method)
+
+    def verify(self, pwhash, password):
+        """True if password matches pwhash (made with any supported method)"""
+        if not pwhash:
+            return False
+        return self._run(check_password_hash, pwhash, password)
+
+    def needs_rehash(self, pwhash):
+        """True if pwhash was made with a different method or cost"""
+        return normalize_method(pwhash.split('$', 1)[0]) != self.method
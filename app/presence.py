@@ -0,0 +1,169 @@
+"""
+Chat session registry and presence
+
+Tracks which Socket.IO connection (sid) is in which chat room, on which node.
+The memory backend only sees this process; the redis backend shares the
+registry across every node behind the load balancer.
+"""
+
+import threading
+
+from app.redis_client import get_redis
+
+
+class MemoryPresenceBackend:
+    """Registry for a single process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._sessions = {}  # sid -> info
+
+    def add(self, sid, info):
+        with self._lock:
+            self._sessions[sid] = info
+
+    def remove(self, sid):
+        with self._lock:
+            return self._sessions.pop(sid, None)
+
+    def get(self, sid):
+        with self._lock:
+            return self._sessions.get(sid)
+
+    def room_members(self, room):
+        with self._lock:
+            return [dict(info, sid=sid) for sid, info in self._sessions.items()
+                    if info['session_id'] == room]
+
+    def room_counts(self):
+        with self._lock:
+            counts = {}
+            for info in self._sessions.values():
+                counts[info['session_id']] = counts.get(info['session_id'], 0) + 1
+            return counts
+
+    def node_counts(self):
+        with self._lock:
+            counts = {}
+            for info in self._sessions.values():
+                counts[info['node']] = counts.get(info['node'], 0) + 1
+            return counts
+
+    def purge_node(self, node):
+        with self._lock:
+            stale = [sid for sid, info in self._sessions.items() if info['node'] == node]
+            for sid in stale:
+                del self._sessions[sid]
+            return len(stale)
+
+
+class RedisPresenceBackend:
+    """Registry shared through Redis (or a memory:// LocalRedis stand-in)"""
+
+    def __init__(self, client, prefix='presence'):
+        self.redis = client
+        self.prefix = prefix
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + parts)
+
+    def add(self, sid, info):
+        previous = self.get(sid)
+        pipe = self.redis.pipeline()
+        if previous:
+            pipe.srem(self._key('room', previous['session_id']), sid)
+        pipe.hset(self._key('sid', sid), mapping=info)
+        pipe.sadd(self._key('room', info['session_id']), sid)
+        pipe.sadd(self._key('rooms'), info['session_id'])
+        pipe.sadd(self._key('node', info['node']), sid)
+        pipe.sadd(self._key('nodes'), info['node'])
+        pipe.execute()
+
+    def remove(self, sid):
+        info = self.get(sid)
+        if not info:
+            return None
+        pipe = self.redis.pipeline()
+        pipe.delete(self._key('sid', sid))
+        pipe.srem(self._key('room', info['session_id']), sid)
+        pipe.srem(self._key('node', info['node']), sid)
+        pipe.execute()
+        if not self.redis.scard(self._key('room', info['session_id'])):
+            self.redis.srem(self._key('rooms'), info['session_id'])
+        return info
+
+    def get(self, sid):
+        return self.redis.hgetall(self._key('sid', sid)) or None
+
+    def room_members(self, room):
+        sids = sorted(self.redis.smembers(self._key('room', room)))
+        pipe = self.redis.pipeline()
+        for sid in sids:
+            pipe.hgetall(self._key('sid', sid))
+        return [dict(info, sid=sid) for sid, info in zip(sids, pipe.execute()) if info]
+
+    def _counts(self, kind):
+        names = sorted(self.redis.smembers(self._key(kind + 's')))
+        pipe = self.redis.pipeline()
+        for name in names:
+            pipe.scard(self._key(kind, name))
+        return {name: count for name, count in zip(names, pipe.execute()) if count}
+
+    def room_counts(self):
+        return self._counts('room')
+
+    def node_counts(self):
+        return self._counts('node')
+
+    def purge_node(self, node):
+        """Forget every sid a (restarted or dead) node left behind"""
+        sids = self.redis.smembers(self._key('node', node))
+        for sid in sids:
+            self.remove(sid)
+        self.redis.delete(self._key('node', node))
+        self.redis.srem(self._key('nodes'), node)
+        return len(sids)
+
+
+class PresenceRegistry:
+    """Pluggable chat session registry, configured from the app config"""
+
+    def __init__(self, app=None):
+        self.backend = MemoryPresenceBackend()
+        self.node = 'Server-1'
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Pick the backend and clear this node's entries from a previous run"""
+        self.node = app.config['SERVER_NAME_ID']
+        if app.config['CHAT_PRESENCE_BACKEND'] == 'redis':
+            client = get_redis(app.config['CHAT_PRESENCE_REDIS_URL'])
+            self.backend = RedisPresenceBackend(client)
+        else:
+            self.backend = MemoryPresenceBackend()
+        # Sockets from before a restart are gone; don't keep counting them
+        self.backend.purge_node(self.node)
+        app.extensions['presence'] = self
+
+    def join(self, sid, session_id, username):
+        """Record that sid is in the session_id room"""
+        self.backend.add(sid, {'session_id': session_id, 'username': username, 'node': self.node})
+
+    def leave(self, sid):
+        """Forget sid; returns what was known about it, if anything"""
+        return self.backend.remove(sid)
+
+    def get(self, sid):
+        return self.backend.get(sid)
+
+    def room_members(self, room):
+        return self.backend.room_members(room)
+
+    def stats(self):
+        """Connection counts per room and per node"""
+        return {
+            'node': self.node,
+            'rooms': self.backend.room_counts(),
+            'nodes': self.backend.node_counts()
+        }
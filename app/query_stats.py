@@ -0,0 +1,167 @@
+"""
+SQL query instrumentation
+
+SQLAlchemy cursor events time every statement. Within a request the count,
+total DB time and statement shapes are collected; statements slower than
+SQL_SLOW_QUERY_MS are logged with the endpoint that ran them, and a request
+that runs the same statement SQL_N_PLUS_ONE_THRESHOLD times or more is
+flagged as a suspected N+1 (e.g. a lazy relationship loaded in a loop).
+
+Totals go to the metrics extension on every request and, in debug mode, out
+as X-Query-* response headers. Tests can wrap code in query_budget(n).
+"""
+
+import contextvars
+import logging
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+from flask import g, has_request_context, request
+from sqlalchemy import event
+from sqlalchemy.engine import Engine
+
+logger = logging.getLogger(__name__)
+
+_trackers = contextvars.ContextVar('query_trackers', default=())
+_listening = False
+_listening_lock = threading.Lock()
+
+
+class QueryTracker:
+    """Queries seen while this tracker was active"""
+
+    __slots__ = ('count', 'seconds', 'shapes')
+
+    def __init__(self):
+        self.count = 0
+        self.seconds = 0.0
+        self.shapes = Counter()
+
+    def record(self, statement, seconds):
+        self.count += 1
+        self.seconds += seconds
+        self.shapes[statement] += 1
+
+    def repeated(self, threshold):
+        """(statement, times) for statements run at least threshold times"""
+        return [(statement, times) for statement, times in self.shapes.most_common() if times >= threshold]
+
+
+@contextmanager
+def track_queries():
+    """Collect every query run inside the block (nested blocks all see them)"""
+    tracker = QueryTracker()
+    token = _trackers.set(_trackers.get() + (tracker,))
+    try:
+        yield tracker
+    finally:
+        _trackers.reset(token)
+
+
+@contextmanager
+def query_budget(max_queries):
+    """Fail (AssertionError) if the block runs more than max_queries queries"""
+    with track_queries() as tracker:
+        yield tracker
+    if tracker.count > max_queries:
+        shapes = '\n'.join(f'  {times}x {statement}' for statement, times in tracker.shapes.most_common())
+        raise AssertionError(f'{tracker.count} queries, budget was {max_queries}:\n{shapes}')
+
+
+def _shape(statement):
+    return ' '.join(statement.split())
+
+
+class QueryInspector:
+    """Per-request query counts, slow-query log and N+1 detection"""
+
+    def __init__(self, metrics=None, app=None):
+        self.metrics = metrics
+        self.enabled = True
+        self.slow_seconds = 0.1
+        self.n_plus_one_threshold = 5
+        self.debug_headers = False
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read thresholds and hook the request lifecycle"""
+        self.enabled = app.config['SQL_INSTRUMENTATION']
+        self.slow_seconds = app.config['SQL_SLOW_QUERY_MS'] / 1000.0
+        self.n_plus_one_threshold = app.config['SQL_N_PLUS_ONE_THRESHOLD']
+        debug_headers = app.config['SQL_DEBUG_HEADERS']
+        self.debug_headers = app.debug if debug_headers is None else debug_headers
+        if self.enabled:
+            self._listen()
+            app.before_request(self._start_request)
+            app.after_request(self._finish_request)
+            app.teardown_request(self._stop_request)
+        app.extensions['query_inspector'] = self
+
+    def _listen(self):
+        """Attach the cursor hooks to every engine, once per process"""
+        global _listening
+        with _listening_lock:
+            if _listening:
+                return
+            _listening = True
+        event.listen(Engine, 'before_cursor_execute', self._before_execute)
+        event.listen(Engine, 'after_cursor_execute', self._after_execute)
+        event.listen(Engine, 'handle_error', self._on_error)
+
+    def _before_execute(self, conn, cursor, statement, parameters, context, executemany):
+        if not self.enabled:
+            return
+        conn.info.setdefault('query_started', []).append(time.perf_counter())
+
+    def _on_error(self, exception_context):
+        started = exception_context.connection.info.get('query_started') if exception_context.connection else None
+        if started:
+            started.pop()
+
+    def _after_execute(self, conn, cursor, statement, parameters, context, executemany):
+        started = conn.info.get('query_started')
+        if not started:
+            return
+        seconds = time.perf_counter() - started.pop()
+        trackers = _trackers.get()
+        if trackers:
+            shape = _shape(statement)
+            for tracker in trackers:
+                tracker.record(shape, seconds)
+        if seconds >= self.slow_seconds:
+            endpoint = request.endpoint if has_request_context() else 'background'
+            logger.warning('Slow query (%.1f ms) in %s: %s', seconds * 1000, endpoint, _shape(statement))
+
+    # -- request lifecycle ---------------------------------------------------
+
+    def _start_request(self):
+        g._query_tracker = tracker = QueryTracker()
+        g._query_token = _trackers.set(_trackers.get() + (tracker,))
+
+    def _finish_request(self, response):
+        tracker = g.get('_query_tracker')
+        if tracker is None:
+            return response
+
+        repeated = tracker.repeated(self.n_plus_one_threshold)
+        for statement, times in repeated:
+            logger.warning('Suspected N+1 in %s: %d x %s', request.endpoint, times, statement)
+
+        if self.metrics is not None and self.metrics.enabled:
+            self.metrics.observe_queries(request.blueprint or '', request.endpoint or 'unmatched',
+                                         tracker.count, tracker.seconds, len(repeated))
+
+        if self.debug_headers:
+            response.headers['X-Query-Count'] = str(tracker.count)
+            response.headers['X-Query-Time-Ms'] = f'{tracker.seconds * 1000:.2f}'
+            response.headers['X-Query-Suspected-N-Plus-One'] = str(len(repeated))
+        return response
+
+    def _stop_request(self, exc):
+        token = g.pop('_query_token', None)
+        if token is not None:
+            _trackers.reset(token)
+        g.pop('_query_tracker', None)
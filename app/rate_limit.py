@@ -0,0 +1,189 @@
+"""
+Token-bucket rate limiting
+
+Each limit in RATE_LIMITS is a bucket of `burst` tokens refilled at `rate`
+tokens per `per` seconds, kept per key (an IP address, a username, a user or
+a Socket.IO connection). A request takes one token or is refused with the
+time until one is available.
+
+The memory backend keeps buckets in this process. The redis backend shares
+them across nodes with one atomic round trip per check (a Lua script on
+Redis, the store lock on a memory:// stand-in).
+"""
+
+import math
+import threading
+import time
+from functools import wraps
+
+from flask import jsonify, request
+from flask_socketio import emit
+
+from app.redis_client import get_redis
+
+
+class MemoryRateLimitBackend:
+    """Buckets for a single process"""
+
+    def __init__(self, max_keys=100000, clock=time.monotonic):
+        self.max_keys = max_keys
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._buckets = {}  # key -> [tokens, updated_at, full_at]
+
+    def take(self, key, rate, burst):
+        """Take a token; returns the tokens left, or a negative shortfall"""
+        with self._lock:
+            now = self.clock()
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                if len(self._buckets) >= self.max_keys:
+                    self._evict(now)
+                tokens = burst
+            else:
+                tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            result = tokens - 1
+            if tokens >= 1:
+                tokens -= 1
+            self._buckets[key] = [tokens, now, now + (burst - tokens) / rate]
+            return result
+
+    def _evict(self, now):
+        """Refilled buckets are the same as missing ones; drop those first"""
+        full = [key for key, bucket in self._buckets.items() if bucket[2] <= now]
+        for key in full:
+            del self._buckets[key]
+        if len(self._buckets) >= self.max_keys:
+            # Still full of active keys: forget the ones closest to refilled
+            for key in sorted(self._buckets, key=lambda k: self._buckets[k][2])[:len(self._buckets) // 10 + 1]:
+                del self._buckets[key]
+
+    def reset(self):
+        with self._lock:
+            self._buckets.clear()
+
+
+TOKEN_BUCKET_LUA = """
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+local rate, burst, now = tonumber(ARGV[1]), tonumber(ARGV[2]), tonumber(ARGV[3])
+local tokens = tonumber(bucket[1]) or burst
+local updated = tonumber(bucket[2]) or now
+tokens = math.min(burst, tokens + math.max(0, now - updated) * rate)
+local result = tokens - 1
+if tokens >= 1 then tokens = tokens - 1 end
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated', tostring(now))
+redis.call('PEXPIRE', KEYS[1], math.ceil((burst - tokens) / rate * 1000) + 1000)
+return tostring(result)
+"""
+
+
+class RedisRateLimitBackend:
+    """Buckets shared through Redis (or a memory:// LocalRedis stand-in)"""
+
+    def __init__(self, client, prefix='ratelimit', clock=time.time):
+        self.redis = client
+        self.prefix = prefix
+        self.clock = clock
+        self._script = client.register_script(TOKEN_BUCKET_LUA) if hasattr(client, 'register_script') else None
+
+    def take(self, key, rate, burst):
+        key = f'{self.prefix}:{key}'
+        now = self.clock()
+        if self._script is not None:
+            return float(self._script(keys=[key], args=[rate, burst, now]))
+
+        with self.redis.atomic():
+            bucket = self.redis.hgetall(key)
+            tokens = float(bucket.get('tokens', burst))
+            updated = float(bucket.get('updated', now))
+            tokens = min(burst, tokens + max(0.0, now - updated) * rate)
+            result = tokens - 1
+            if tokens >= 1:
+                tokens -= 1
+            self.redis.hset(key, mapping={'tokens': tokens, 'updated': now})
+            self.redis.expire(key, (burst - tokens) / rate + 1)
+            return result
+
+    def reset(self):
+        for key in list(self.redis.scan_iter(match=f'{self.prefix}:*')):
+            self.redis.delete(key)
+
+
+class RateLimiter:
+    """Named token-bucket limits configured from RATE_LIMITS"""
+
+    def __init__(self, app=None):
+        self.enabled = True
+        self.limits = {}
+        self.backend = MemoryRateLimitBackend()
+        self._lock = threading.Lock()
+        self._stats = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Pick the backend and read the limits"""
+        self.enabled = app.config['RATE_LIMIT_ENABLED']
+        self.limits = {
+            name: (options['rate'] / float(options.get('per', 1)), options.get('burst', options['rate']))
+            for name, options in app.config['RATE_LIMITS'].items()
+        }
+        if app.config['RATE_LIMIT_BACKEND'] == 'redis':
+            self.backend = RedisRateLimitBackend(get_redis(app.config['RATE_LIMIT_REDIS_URL']))
+        else:
+            self.backend = MemoryRateLimitBackend()
+        with self._lock:
+            self._stats = {name: {'allowed': 0, 'limited': 0} for name in self.limits}
+        app.extensions['rate_limiter'] = self
+
+    def hit(self, name, key):
+        """
+        Take a token from the name/key bucket. Returns (allowed, retry_after)
+        where retry_after is the seconds until a token is available.
+        """
+        if not self.enabled or key is None:
+            return True, 0
+        rate, burst = self.limits[name]
+        remaining = self.backend.take(f'{name}:{key}', rate, burst)
+        allowed = remaining >= 0
+        with self._lock:
+            self._stats[name]['allowed' if allowed else 'limited'] += 1
+        return allowed, 0 if allowed else -remaining / rate
+
+    def reset(self):
+        """Refill every bucket"""
+        self.backend.reset()
+
+    def stats(self):
+        with self._lock:
+            return {name: dict(counts) for name, counts in self._stats.items()}
+
+
+def client_ip():
+    return request.remote_addr or 'unknown'
+
+
+def rate_limited(limiter, name, key=client_ip):
+    """
+    Decorator for views and Socket.IO handlers. key() returns the bucket key
+    (None skips the check). Views answer 429 with Retry-After; Socket.IO
+    handlers emit an error to the sender and drop the event.
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapped(*args, **kwargs):
+            allowed, retry_after = limiter.hit(name, key())
+            if allowed:
+                return handler(*args, **kwargs)
+
+            retry_after = max(1, math.ceil(retry_after))
+            message = 'Too many requests. Please try again later.'
+            if getattr(request, 'sid', None):
+                emit('error', {'message': message, 'rate_limited': True, 'retry_after': retry_after})
+                return None
+
+            response = jsonify({'success': False, 'message': message, 'retry_after': retry_after})
+            response.headers['Retry-After'] = str(retry_after)
+            return response, 429
+        return wrapped
+    return decorator
@@ -0,0 +1,232 @@
+"""
+Redis connections for shared (cross-node) state
+
+get_redis('redis://...') returns a real redis client. get_redis('memory://name')
+returns an in-process LocalRedis stand-in that implements the handful of
+commands this app uses, so shared backends can be exercised in tests and
+single-node setups without a Redis server. Clients for the same memory://
+name share one store, just like two nodes pointed at the same Redis.
+"""
+
+import fnmatch
+import threading
+import time
+
+_local_stores = {}
+_local_stores_lock = threading.Lock()
+
+
+def get_redis(url):
+    """Return a client for url, or None if url is empty"""
+    if not url:
+        return None
+    if url.startswith('memory://'):
+        name = url[len('memory://'):] or 'default'
+        with _local_stores_lock:
+            if name not in _local_stores:
+                _local_stores[name] = LocalRedis()
+            return _local_stores[name]
+
+    import redis
+    return redis.Redis.from_url(url, decode_responses=True)
+
+
+class LocalRedis:
+    """Thread-safe, in-process subset of the Redis API (strings decoded)"""
+
+    def __init__(self):
+        self._data = {}
+        self._expires = {}
+        self._lock = threading.RLock()
+
+    # -- housekeeping ------------------------------------------------------
+
+    def _alive(self, key):
+        expires = self._expires.get(key)
+        if expires is not None and expires <= time.time():
+            self._data.pop(key, None)
+            self._expires.pop(key, None)
+        return key in self._data
+
+    def _get(self, key, factory):
+        if not self._alive(key):
+            self._data[key] = factory()
+        return self._data[key]
+
+    def flushall(self):
+        with self._lock:
+            self._data.clear()
+            self._expires.clear()
+
+    def ping(self):
+        return True
+
+    def atomic(self):
+        """Hold the store lock across several commands (what a Lua script gives on Redis)"""
+        return self._lock
+
+    # -- keys --------------------------------------------------------------
+
+    def delete(self, *keys):
+        with self._lock:
+            removed = 0
+            for key in keys:
+                if self._alive(key):
+                    del self._data[key]
+                    self._expires.pop(key, None)
+                    removed += 1
+            return removed
+
+    def exists(self, *keys):
+        with self._lock:
+            return sum(1 for key in keys if self._alive(key))
+
+    def expire(self, key, seconds):
+        with self._lock:
+            if not self._alive(key):
+                return False
+            self._expires[key] = time.time() + seconds
+            return True
+
+    def ttl(self, key):
+        with self._lock:
+            if not self._alive(key):
+                return -2
+            expires = self._expires.get(key)
+            return -1 if expires is None else max(0, int(expires - time.time()))
+
+    def scan_iter(self, match='*', count=None):
+        with self._lock:
+            keys = [key for key in list(self._data) if self._alive(key)]
+        return iter([key for key in keys if fnmatch.fnmatchcase(key, match)])
+
+    # -- strings -----------------------------------------------------------
+
+    def get(self, key):
+        with self._lock:
+            return self._data.get(key) if self._alive(key) else None
+
+    def set(self, key, value, ex=None, px=None, nx=False):
+        with self._lock:
+            if nx and self._alive(key):
+                return None
+            self._data[key] = str(value) if not isinstance(value, (str, bytes)) else value
+            self._expires.pop(key, None)
+            if ex is not None:
+                self._expires[key] = time.time() + ex
+            elif px is not None:
+                self._expires[key] = time.time() + px / 1000.0
+            return True
+
+    def setex(self, key, seconds, value):
+        return self.set(key, value, ex=seconds)
+
+    def mget(self, keys):
+        with self._lock:
+            return [self.get(key) for key in keys]
+
+    def incr(self, key, amount=1):
+        with self._lock:
+            value = int(self.get(key) or 0) + amount
+            self._data[key] = str(value)
+            return value
+
+    def incrby(self, key, amount):
+        return self.incr(key, amount)
+
+    # -- hashes ------------------------------------------------------------
+
+    def hset(self, key, field=None, value=None, mapping=None):
+        with self._lock:
+            data = self._get(key, dict)
+            items = dict(mapping or {})
+            if field is not None:
+                items[field] = value
+            added = sum(1 for f in items if f not in data)
+            data.update({f: str(v) for f, v in items.items()})
+            return added
+
+    def hget(self, key, field):
+        with self._lock:
+            return self._data[key].get(field) if self._alive(key) else None
+
+    def hgetall(self, key):
+        with self._lock:
+            return dict(self._data[key]) if self._alive(key) else {}
+
+    def hdel(self, key, *fields):
+        with self._lock:
+            if not self._alive(key):
+                return 0
+            data = self._data[key]
+            removed = sum(1 for f in fields if data.pop(f, None) is not None)
+            if not data:
+                self.delete(key)
+            return removed
+
+    def hincrby(self, key, field, amount=1):
+        with self._lock:
+            data = self._get(key, dict)
+            data[field] = str(int(data.get(field, 0)) + amount)
+            return int(data[field])
+
+    # -- sets --------------------------------------------------------------
+
+    def sadd(self, key, *members):
+        with self._lock:
+            data = self._get(key, set)
+            added = len(set(members) - data)
+            data.update(members)
+            return added
+
+    def srem(self, key, *members):
+        with self._lock:
+            if not self._alive(key):
+                return 0
+            data = self._data[key]
+            removed = len(data & set(members))
+            data.difference_update(members)
+            if not data:
+                self.delete(key)
+            return removed
+
+    def smembers(self, key):
+        with self._lock:
+            return set(self._data[key]) if self._alive(key) else set()
+
+    def scard(self, key):
+        with self._lock:
+            return len(self._data[key]) if self._alive(key) else 0
+
+    # -- pipelines -----------------------------------------------------------
+
+    def pipeline(self, transaction=True):
+        return LocalPipeline(self)
+
+
+class LocalPipeline:
+    """Queues commands and runs them under the store lock on execute()"""
+
+    def __init__(self, store):
+        self._store = store
+        self._commands = []
+
+    def __getattr__(self, name):
+        method = getattr(self._store, name)
+
+        def queue(*args, **kwargs):
+            self._commands.append((method, args, kwargs))
+            return self
+        return queue
+
+    def execute(self):
+        with self._store._lock:
+            results = [method(*args, **kwargs) for method, args, kwargs in self._commands]
+        self._commands = []
+        return results
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self._commands = []
@@ -1,16 +1,23 @@
 from flask import Blueprint, request, jsonify, session
 from flask_login import login_user, logout_user, login_required, current_user
-from app import db, login_manager
+from app import db, login_manager, identity_cache, rate_limiter, session_store
+from app.rate_limit import rate_limited
 from app.models import User
 
 bp = Blueprint('auth', __name__)
 
 @login_manager.user_loader
 def load_user(user_id):
-    """Load user by ID for Flask-Login"""
-    return User.query.get(int(user_id))
+    """Load user by ID for Flask-Login (served from the identity cache)"""
+    return identity_cache.load(int(user_id))
+
+def attempted_username():
+    """Username from a login request body, lower-cased, or None"""
+    username = (request.get_json(silent=True) or {}).get('username')
+    return username.lower() if isinstance(username, str) else None
 
 @bp.route('/register', methods=['POST'])
+@rate_limited(rate_limiter, 'register_ip')
 def register():
     """User registration endpoint"""
     try:
@@ -29,6 +36,9 @@ def register():
         if User.query.filter_by(email=data['email']).first():
             return jsonify({'success': False, 'message': 'Email already exists'}), 400
         
+        # Hashing takes a while; don't hold a pooled connection meanwhile
+        db.session.rollback()
+        
         # Create new user
         user = User(
             username=data['username'],
@@ -56,6 +66,8 @@ def register():
         return jsonify({'success': False, 'message': str(e)}), 500
 
 @bp.route('/login', methods=['POST'])
+@rate_limited(rate_limiter, 'login_ip')
+@rate_limited(rate_limiter, 'login_user', key=attempted_username)
 def login():
     """User login endpoint"""
     try:
@@ -67,9 +79,19 @@ def login():
         
         # Find user
         user = User.query.filter_by(username=data['username']).first()
+        if user:
+            # Hashing takes a while; don't hold a pooled connection meanwhile
+            db.session.expunge(user)
+            db.session.rollback()
         
         if user and user.check_password(data['password']):
+            # Upgrade hashes made with older algorithm/cost settings
+            if user.password_needs_rehash():
+                user.set_password(data['password'])
+                db.session.add(user)
+                db.session.commit()
             login_user(user, remember=data.get('remember', False))
+            identity_cache.store(user)
             return jsonify({
                 'success': True,
                 'message': 'Login successful',
@@ -85,9 +107,20 @@ def login():
 @login_required
 def logout():
     """User logout endpoint"""
+    identity_cache.invalidate(current_user.id)
     logout_user()
     return jsonify({'success': True, 'message': 'Logout successful'}), 200
 
+@bp.route('/logout-all', methods=['POST'])
+@login_required
+def logout_all():
+    """Sign the current user out of every session on every device"""
+    user_id = current_user.id
+    identity_cache.invalidate(user_id)
+    logout_user()
+    revoked = session_store.revoke_user(user_id)
+    return jsonify({'success': True, 'message': 'Logged out everywhere', 'sessions_revoked': revoked}), 200
+
 @bp.route('/current-user', methods=['GET'])
 @login_required
 def get_current_user():
@@ -119,6 +152,7 @@ def update_profile():
             current_user.email = data['email']
         
         db.session.commit()
+        identity_cache.invalidate(current_user.id)
         
         return jsonify({
             'success': True,
@@ -129,3 +163,11 @@ def update_profile():
     except Exception as e:
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
+
+@bp.route('/identity-cache', methods=['GET'])
+def get_identity_cache_stats():
+    """Hit ratio and size of the signed-in user cache"""
+    return jsonify({
+        'success': True,
+        'cache': identity_cache.stats()
+    }), 200
@@ -1,16 +1,22 @@
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
-from app import db
+from app import db, rate_limiter
+from app.rate_limit import rate_limited
 from app.models import CartItem, Product
+from sqlalchemy.orm import joinedload
 
 bp = Blueprint('cart', __name__)
 
+def cart_owner():
+    return current_user.id
+
 @bp.route('/', methods=['GET'])
 @login_required
 def get_cart():
     """Get user's shopping cart"""
     try:
-        cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
+        # Load products with the items rather than one query per item
+        cart_items = CartItem.query.options(joinedload(CartItem.product)).filter_by(user_id=current_user.id).all()
         items = [item.to_dict() for item in cart_items]
         
         total = sum(item['subtotal'] for item in items)
@@ -27,6 +33,7 @@ def get_cart():
 
 @bp.route('/add', methods=['POST'])
 @login_required
+@rate_limited(rate_limiter, 'cart', key=cart_owner)
 def add_to_cart():
     """Add item to shopping cart"""
     try:
@@ -79,6 +86,7 @@ def add_to_cart():
 
 @bp.route('/update/<int:item_id>', methods=['PUT'])
 @login_required
+@rate_limited(rate_limiter, 'cart', key=cart_owner)
 def update_cart_item(item_id):
     """Update cart item quantity"""
     try:
@@ -113,6 +121,7 @@ def update_cart_item(item_id):
 
 @bp.route('/remove/<int:item_id>', methods=['DELETE'])
 @login_required
+@rate_limited(rate_limiter, 'cart', key=cart_owner)
 def remove_from_cart(item_id):
     """Remove item from cart"""
     try:
@@ -138,6 +147,7 @@ def remove_from_cart(item_id):
 
 @bp.route('/clear', methods=['DELETE'])
 @login_required
+@rate_limited(rate_limiter, 'cart', key=cart_owner)
 def clear_cart():
     """Clear all items from cart"""
     try:
@@ -1,20 +1,142 @@
-from flask import Blueprint, render_template, request
+from flask import Blueprint, render_template, request, current_app, jsonify
 from flask_socketio import emit, join_room, leave_room
-from flask_login import current_user
-from app import socketio, db
-from app.models import ChatMessage
+from flask_login import current_user, login_required
+from app import socketio, db, chat_writer, intent_engine, presence, event_throttles, support_queue, chat_search, rate_limiter
+from app.throttle import throttled
+from app.rate_limit import rate_limited
+from app.models import ChatMessage, ChatIntent
+from sqlalchemy import and_, or_
+from datetime import datetime, timedelta
 import uuid
 
 bp = Blueprint('chat', __name__)
 
-# Store active chat sessions
-active_sessions = {}
-
 @bp.route('/')
 def chat_page():
     """Chat interface page"""
     return render_template('chat.html')
 
+@bp.route('/intents', methods=['GET'])
+def get_intents():
+    """List the support bot's active intent rules"""
+    return jsonify({
+        'success': True,
+        'source': intent_engine.source,
+        'intents': intent_engine.intents()
+    }), 200
+
+@bp.route('/intents', methods=['POST'])
+@login_required
+def save_intent():
+    """Create or update a support bot intent (support staff only - simplified for demo)"""
+    try:
+        data = request.get_json()
+        
+        required_fields = ['name', 'keywords', 'response']
+        for field in required_fields:
+            if field not in data:
+                return jsonify({'success': False, 'message': f'{field} is required'}), 400
+        
+        keywords = data['keywords']
+        if isinstance(keywords, list):
+            keywords = ','.join(keywords)
+        
+        intent = ChatIntent.query.filter_by(name=data['name']).first()
+        if not intent:
+            intent = ChatIntent(name=data['name'])
+            db.session.add(intent)
+        
+        intent.keywords = keywords
+        intent.response = data['response']
+        intent.priority = int(data.get('priority', 0))
+        intent.is_active = data.get('is_active', True)
+        db.session.commit()
+        
+        # Pick the change up now rather than at the next reload check
+        intent_engine.reload()
+        
+        return jsonify({
+            'success': True,
+            'message': 'Intent saved',
+            'intent': intent.to_dict()
+        }), 200
+        
+    except Exception as e:
+        db.session.rollback()
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+@bp.route('/presence', methods=['GET'])
+def get_presence():
+    """Live chat connection counts per room and per node"""
+    return jsonify({
+        'success': True,
+        'presence': presence.stats()
+    }), 200
+
+@bp.route('/support/queue', methods=['GET'])
+def get_support_queue():
+    """Waiting sessions, agent load and queue wait-time percentiles"""
+    return jsonify({
+        'success': True,
+        'queue': support_queue.stats()
+    }), 200
+
+@bp.route('/throttles', methods=['GET'])
+def get_throttle_stats():
+    """Received, emitted and suppressed counts for throttled Socket.IO events"""
+    return jsonify({
+        'success': True,
+        'throttles': event_throttles.stats()
+    }), 200
+
+@bp.route('/search', methods=['GET'])
+@login_required
+def search_transcripts():
+    """Full-text search over chat transcripts (support staff only - simplified for demo)"""
+    try:
+        search = request.args.get('q', '').strip()
+        if not search:
+            return jsonify({'success': False, 'message': 'q is required'}), 400
+
+        try:
+            start = parse_date(request.args.get('from'))
+            end = parse_date(request.args.get('to'), end_of_day=True)
+        except ValueError:
+            return jsonify({'success': False, 'message': 'from/to must be ISO dates'}), 400
+
+        is_support = request.args.get('is_support')
+        if is_support is not None:
+            is_support = is_support.lower() in ('1', 'true', 'yes')
+
+        limit = request.args.get('limit', current_app.config['CHAT_SEARCH_PAGE_SIZE'], type=int)
+        limit = max(1, min(limit, current_app.config['CHAT_SEARCH_MAX_PAGE_SIZE']))
+
+        # Include messages still waiting in the write-behind buffer
+        chat_writer.flush()
+        messages, cursor = chat_search.search_messages(
+            search, start=start, end=end, is_support=is_support,
+            cursor=request.args.get('cursor'), limit=limit
+        )
+
+        return jsonify({
+            'success': True,
+            'messages': messages,
+            'cursor': cursor,
+            'has_more': cursor is not None
+        }), 200
+
+    except Exception as e:
+        return jsonify({'success': False, 'message': str(e)}), 500
+
+def parse_date(value, end_of_day=False):
+    """Parse an ISO date or datetime; a bare 'to' date covers that whole day"""
+    if not value:
+        return None
+    parsed = datetime.fromisoformat(value)
+    if end_of_day and len(value) == 10:
+        parsed += timedelta(days=1)
+    return parsed
+
 @socketio.on('connect')
 def handle_connect():
     """Handle client connection"""
@@ -25,6 +147,23 @@ def handle_connect():
 def handle_disconnect():
     """Handle client disconnection"""
     print(f'Client disconnected: {request.sid}')
+    
+    # Closing the tab never sends leave_chat, so clean up here as well
+    sid = request.sid
+    event_throttles.get('typing').drop_matching(lambda key: key[1] == sid)
+    session_info = presence.leave(sid)
+    
+    # Sessions held by a departing agent go back to the queue
+    if support_queue.is_agent(sid):
+        notify_assignments(support_queue.unregister_agent(sid))
+    elif session_info and not presence.room_members(session_info['session_id']):
+        support_queue.cancel(session_info['session_id'])
+    
+    if session_info:
+        emit('user_left', {
+            'username': session_info['username'],
+            'message': f"{session_info['username']} left the chat"
+        }, room=session_info['session_id'])
 
 @socketio.on('join_chat')
 def handle_join_chat(data):
@@ -41,19 +180,19 @@ def handle_join_chat(data):
         join_room(session_id)
         
         # Store session info
-        active_sessions[request.sid] = {
-            'session_id': session_id,
-            'username': username
-        }
+        presence.join(request.sid, session_id, username)
         
-        # Load previous messages for this session
-        previous_messages = ChatMessage.query.filter_by(session_id=session_id).order_by(ChatMessage.timestamp).all()
-        messages = [msg.to_dict() for msg in previous_messages]
+        # Load only the most recent page of messages for this session,
+        # including anything still waiting in the write-behind buffer
+        chat_writer.flush()
+        messages, cursor = load_history(session_id)
         
         emit('chat_joined', {
             'session_id': session_id,
             'username': username,
-            'messages': messages
+            'messages': messages,
+            'has_more': cursor is not None,
+            'cursor': cursor
         })
         
         # Notify others in the room
@@ -65,6 +204,60 @@ def handle_join_chat(data):
     except Exception as e:
         emit('error', {'message': str(e)})
 
+@socketio.on('load_older')
+def handle_load_older(data):
+    """Send the page of messages that precedes the given cursor"""
+    try:
+        session_id = data.get('session_id')
+        before = data.get('before')
+        
+        if not session_id or not before:
+            emit('error', {'message': 'Session ID and cursor are required'})
+            return
+        
+        messages, cursor = load_history(session_id, before=before, limit=data.get('limit'))
+        
+        emit('older_messages', {
+            'session_id': session_id,
+            'messages': messages,
+            'has_more': cursor is not None,
+            'cursor': cursor
+        })
+        
+    except Exception as e:
+        emit('error', {'message': str(e)})
+
+def load_history(session_id, before=None, limit=None):
+    """
+    Return (messages, cursor) for one page of a session's history.
+    
+    Messages are oldest first and end just before the `before` cursor (or at
+    the newest message). The returned cursor points at the oldest message in
+    the page and is None when there is nothing older.
+    """
+    page_size = current_app.config['CHAT_HISTORY_PAGE_SIZE']
+    limit = min(int(limit or page_size), current_app.config['CHAT_HISTORY_MAX_PAGE_SIZE'])
+    
+    query = ChatMessage.query.filter_by(session_id=session_id)
+    if before:
+        # Keyset pagination on (timestamp, id) walks the composite index
+        timestamp, message_id = before.rsplit('_', 1)
+        timestamp = datetime.fromisoformat(timestamp)
+        query = query.filter(or_(
+            ChatMessage.timestamp < timestamp,
+            and_(ChatMessage.timestamp == timestamp, ChatMessage.id < int(message_id))
+        ))
+    
+    rows = query.order_by(ChatMessage.timestamp.desc(), ChatMessage.id.desc()).limit(limit + 1).all()
+    has_more = len(rows) > limit
+    rows = rows[:limit][::-1]
+    
+    cursor = None
+    if has_more:
+        cursor = f'{rows[0].timestamp.isoformat()}_{rows[0].id}'
+    
+    return [msg.to_dict() for msg in rows], cursor
+
 @socketio.on('leave_chat')
 def handle_leave_chat(data):
     """Handle user leaving a chat session"""
@@ -75,8 +268,7 @@ def handle_leave_chat(data):
         leave_room(session_id)
         
         # Remove session info
-        if request.sid in active_sessions:
-            del active_sessions[request.sid]
+        presence.leave(request.sid)
         
         # Notify others in the room
         emit('user_left', {
@@ -88,6 +280,7 @@ def handle_leave_chat(data):
         emit('error', {'message': str(e)})
 
 @socketio.on('send_message')
+@rate_limited(rate_limiter, 'chat_message', key=lambda: request.sid)
 def handle_send_message(data):
     """Handle sending a chat message"""
     try:
@@ -100,92 +293,71 @@ def handle_send_message(data):
             emit('error', {'message': 'Session ID and message are required'})
             return
         
-        # Save message to database
+        # Queue the message for persistence
         user_id = current_user.id if current_user.is_authenticated else None
-        
-        chat_message = ChatMessage(
-            session_id=session_id,
-            user_id=user_id,
-            username=username,
-            message=message_text,
-            is_support=is_support
-        )
-        
-        db.session.add(chat_message)
-        db.session.commit()
+        chat_message = save_message(session_id, username, message_text,
+                                    user_id=user_id, is_support=is_support)
         
         # Broadcast message to all users in the room
         emit('new_message', {
-            'message': chat_message.to_dict()
+            'message': chat_message
         }, room=session_id)
         
-        # Auto-reply from support bot if not a support message
+        # Auto-reply from support bot if not a support message. The reply is
+        # scheduled in the background so this handler returns immediately.
         if not is_support:
-            import time
-            from datetime import datetime
-            time.sleep(1)  # Small delay to simulate typing
-            
-            # Generate auto-response
-            auto_response = generate_auto_response(message_text.lower())
-            
-            # Save support response
-            support_message = ChatMessage(
-                session_id=session_id,
-                user_id=None,
-                username='Support Bot',
-                message=auto_response,
-                is_support=True
-            )
-            
-            db.session.add(support_message)
-            db.session.commit()
-            
-            # Broadcast support response
-            emit('new_message', {
-                'message': support_message.to_dict()
+            emit('user_typing', {
+                'username': 'Support Bot',
+                'is_typing': True
             }, room=session_id)
+            socketio.start_background_task(
+                send_bot_reply,
+                current_app._get_current_object(),
+                session_id,
+                message_text
+            )
         
     except Exception as e:
-        db.session.rollback()
         emit('error', {'message': str(e)})
 
+def save_message(session_id, username, message, user_id=None, is_support=False):
+    """Hand a message to the write-behind writer and return its broadcast payload"""
+    row = {
+        'session_id': session_id,
+        'user_id': user_id,
+        'username': username,
+        'message': message,
+        'is_support': is_support,
+        'timestamp': datetime.utcnow()
+    }
+    chat_writer.submit(row)
+    return ChatMessage(**row).to_dict()
+
+def send_bot_reply(app, session_id, message_text):
+    """Persist and broadcast the support bot's reply after a short typing delay"""
+    socketio.sleep(app.config['CHAT_BOT_REPLY_DELAY'])
+    
+    with app.app_context():
+        try:
+            auto_response = generate_auto_response(message_text)
+            support_message = save_message(session_id, 'Support Bot', auto_response, is_support=True)
+            
+            socketio.emit('new_message', {
+                'message': support_message
+            }, room=session_id)
+            
+        except Exception as e:
+            socketio.emit('error', {'message': str(e)}, room=session_id)
+        
+        finally:
+            socketio.emit('user_typing', {
+                'username': 'Support Bot',
+                'is_typing': False
+            }, room=session_id)
+
 def generate_auto_response(message):
     """Generate automatic response based on message content"""
-    message = message.lower()
-    
-    # Keyword-based responses
-    if any(word in message for word in ['hello', 'hi', 'hey', 'greetings']):
-        return "Hello! Welcome to E-Shop support. How can I assist you today?"
-    
-    elif any(word in message for word in ['order', 'track', 'tracking', 'delivery']):
-        return "To track your order, please go to 'My Orders' in your account dashboard. You can view the status and tracking information there."
-    
-    elif any(word in message for word in ['return', 'refund', 'exchange']):
-        return "We accept returns within 30 days of delivery. Please visit our Returns page for more information, or contact support@eshop.com for assistance."
-    
-    elif any(word in message for word in ['payment', 'pay', 'checkout']):
-        return "We accept various payment methods including credit cards, debit cards, and digital wallets. All transactions are secure and encrypted."
-    
-    elif any(word in message for word in ['shipping', 'delivery', 'ship']):
-        return "We offer free shipping on orders over $50. Standard delivery takes 3-5 business days. Express shipping is also available."
-    
-    elif any(word in message for word in ['product', 'item', 'stock', 'available']):
-        return "You can check product availability on each product page. If an item is out of stock, you can sign up for restock notifications."
-    
-    elif any(word in message for word in ['cancel', 'cancellation']):
-        return "Orders can be cancelled within 1 hour of placement. After that, please contact our support team for assistance."
-    
-    elif any(word in message for word in ['discount', 'coupon', 'promo', 'offer']):
-        return "Check our Deals section for current promotions! Sign up for our newsletter to receive exclusive discount codes."
-    
-    elif any(word in message for word in ['help', 'support', 'assistance']):
-        return "I'm here to help! You can ask me about orders, shipping, returns, payments, or any other questions about our store."
-    
-    elif any(word in message for word in ['thank', 'thanks']):
-        return "You're welcome! Is there anything else I can help you with?"
-    
-    else:
-        return "Thank you for your message! A support representative will assist you shortly. Meanwhile, you can explore our Help Center for quick answers."
+    return intent_engine.respond(message)
 
 @socketio.on('typing')
 def handle_typing(data):
@@ -193,35 +365,97 @@ def handle_typing(data):
     try:
         session_id = data.get('session_id')
         username = data.get('username', 'Guest')
-        is_typing = data.get('is_typing', False)
+        is_typing = bool(data.get('is_typing', False))
+        sid = request.sid
         
-        # Broadcast typing status to others in the room
-        emit('user_typing', {
-            'username': username,
-            'is_typing': is_typing
-        }, room=session_id, skip_sid=request.sid)
+        def broadcast(state):
+            socketio.emit('user_typing', {
+                'username': username,
+                'is_typing': state
+            }, room=session_id, skip_sid=sid)
+        
+        # Keystrokes are coalesced into at most one state change per interval,
+        # with an automatic "stopped" if the client goes quiet
+        event_throttles.get('typing').submit((session_id, sid), is_typing, broadcast)
         
     except Exception as e:
         emit('error', {'message': str(e)})
 
 @socketio.on('support_request')
+@throttled(event_throttles, 'support_request', key=lambda data: data.get('session_id'))
 def handle_support_request(data):
     """Handle support request from user"""
     try:
         session_id = data.get('session_id')
         username = data.get('username', 'Guest')
         
-        # Notify support team (in production, this would alert support staff)
-        emit('support_alert', {
-            'session_id': session_id,
-            'username': username,
-            'message': f'{username} requested support'
-        }, room='support_room')  # Support staff would join this room
+        if not session_id:
+            emit('error', {'message': 'Session ID is required'})
+            return
+        
+        # Signed-in customers are served ahead of guests
+        priority = 1 if current_user.is_authenticated else 0
+        assignments = support_queue.request(session_id, priority=priority, username=username)
         
         # Confirm to user
         emit('support_notified', {
-            'message': 'Support team has been notified. Someone will be with you shortly.'
+            'message': 'Support team has been notified. Someone will be with you shortly.',
+            'queue_depth': support_queue.stats()['waiting']
         })
         
+        notify_assignments(assignments)
+        
+    except Exception as e:
+        emit('error', {'message': str(e)})
+
+@socketio.on('agent_register')
+def handle_agent_register(data):
+    """Register the connected support agent and start routing sessions to them"""
+    try:
+        if not current_user.is_authenticated:
+            emit('error', {'message': 'Login required'})
+            return
+        
+        name = data.get('name') or current_user.username
+        assignments = support_queue.register_agent(request.sid, name, data.get('capacity'))
+        join_room('support_room')
+        
+        emit('agent_registered', {'agent_id': request.sid, 'queue': support_queue.stats()})
+        notify_assignments(assignments)
+        
     except Exception as e:
         emit('error', {'message': str(e)})
+
+@socketio.on('support_end')
+def handle_support_end(data):
+    """Agent is done with a session; their slot goes to the next customer"""
+    try:
+        session_id = data.get('session_id')
+        if support_queue.agent_for(session_id) != request.sid:
+            emit('error', {'message': 'Session is not assigned to you'})
+            return
+        
+        leave_room(session_id)
+        notify_assignments(support_queue.release(session_id))
+        
+    except Exception as e:
+        emit('error', {'message': str(e)})
+
+def notify_assignments(assignments):
+    """Put each chosen agent in the customer's room and tell both sides"""
+    for assignment in assignments:
+        session_id = assignment['session_id']
+        agent_sid = assignment['agent_id']
+        socketio.server.enter_room(agent_sid, session_id, namespace='/')
+        
+        socketio.emit('support_alert', {
+            'session_id': session_id,
+            'username': assignment['info'].get('username', 'Guest'),
+            'wait': round(assignment['wait'], 3),
+            'message': f"{assignment['info'].get('username', 'Guest')} requested support"
+        }, to=agent_sid)
+        
+        socketio.emit('user_joined', {
+            'username': assignment['agent_name'],
+            'message': f"{assignment['agent_name']} from support joined the chat"
+        }, room=session_id, skip_sid=agent_sid)
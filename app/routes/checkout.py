@@ -1,19 +1,24 @@
 from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
-from app import db
+from app import db, checkout_admission, rate_limiter
+from app.admission import admission_required
+from app.rate_limit import rate_limited
 from app.models import Order, OrderItem, CartItem, Product
+from sqlalchemy.orm import joinedload, selectinload
 
 bp = Blueprint('checkout', __name__)
 
 @bp.route('/process', methods=['POST'])
 @login_required
+@rate_limited(rate_limiter, 'checkout', key=lambda: current_user.id)
+@admission_required('checkout')
 def process_checkout():
     """Process checkout and create order"""
     try:
         data = request.get_json()
         
         # Get user's cart
-        cart_items = CartItem.query.filter_by(user_id=current_user.id).all()
+        cart_items = CartItem.query.options(joinedload(CartItem.product)).filter_by(user_id=current_user.id).all()
         
         if not cart_items:
             return jsonify({'success': False, 'message': 'Cart is empty'}), 400
@@ -78,12 +83,31 @@ def process_checkout():
         db.session.rollback()
         return jsonify({'success': False, 'message': str(e)}), 500
 
+@bp.route('/queue', methods=['GET'])
+def get_queue_status():
+    """Live waiting room status, plus the caller's position if a token is given"""
+    status = checkout_admission.status()
+    token = request.args.get('queue_token')
+    
+    response = {'success': True, 'queue': status}
+    if token:
+        ticket = checkout_admission.position(token)
+        if ticket is None:
+            return jsonify({'success': False, 'message': 'Queue token not found or expired'}), 404
+        response['ticket'] = ticket
+    
+    return jsonify(response), 200
+
 @bp.route('/orders', methods=['GET'])
 @login_required
 def get_orders():
     """Get user's order history"""
     try:
-        orders = Order.query.filter_by(user_id=current_user.id).order_by(Order.created_at.desc()).all()
+        orders = (Order.query
+                  .options(selectinload(Order.order_items).joinedload(OrderItem.product))
+                  .filter_by(user_id=current_user.id)
+                  .order_by(Order.created_at.desc())
+                  .all())
         
         return jsonify({
             'success': True,
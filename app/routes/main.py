@@ -1,4 +1,5 @@
-from flask import Blueprint, render_template
+from flask import Blueprint, render_template, request, jsonify, Response
+from app import metrics
 
 bp = Blueprint('main', __name__)
 
@@ -31,3 +32,10 @@ def checkout_page():
 def contact_page():
     """Contact/Support page"""
     return render_template('contact.html')
+
+@bp.route('/metrics')
+def metrics_endpoint():
+    """Request and Socket.IO metrics (Prometheus text, or ?format=json for percentiles)"""
+    if request.args.get('format') == 'json':
+        return jsonify({'success': True, 'metrics': metrics.summary()}), 200
+    return Response(metrics.render(), mimetype='text/plain; version=0.0.4')
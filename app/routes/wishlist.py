@@ -2,6 +2,7 @@ from flask import Blueprint, request, jsonify
 from flask_login import login_required, current_user
 from app import db
 from app.models import WishlistItem, Product
+from sqlalchemy.orm import joinedload
 
 bp = Blueprint('wishlist', __name__)
 
@@ -10,7 +11,7 @@ bp = Blueprint('wishlist', __name__)
 def get_wishlist():
     """Get user's wishlist"""
     try:
-        wishlist_items = WishlistItem.query.filter_by(user_id=current_user.id).all()
+        wishlist_items = WishlistItem.query.options(joinedload(WishlistItem.product)).filter_by(user_id=current_user.id).all()
         items = [item.to_dict() for item in wishlist_items]
         
         return jsonify({
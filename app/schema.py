@@ -0,0 +1,109 @@
+"""
+Schema version check
+
+The database records which schema version it was last brought up to in a
+one-row schema_version table. Startup reads that row and, when it matches
+SCHEMA_VERSION, does nothing else: no create_all() and none of the per-table
+reflection queries it runs. A missing or older version runs the pending
+migrations in order and records the new version.
+
+To change the schema, append a migration to MIGRATIONS; SCHEMA_VERSION
+follows. With DB_SCHEMA_CHECK=verify (e.g. when `flask upgrade-db` runs once
+per deploy) workers refuse to start on an out-of-date database instead of
+migrating it themselves.
+"""
+
+import logging
+
+import click
+from flask.cli import with_appcontext
+from sqlalchemy import Column, Integer, MetaData, Table, exc, inspect, select
+
+logger = logging.getLogger(__name__)
+
+SCHEMA_CHECKS = ('upgrade', 'verify', 'off')
+
+# Kept out of db.metadata so db.drop_all() and create_all() leave it alone
+version_metadata = MetaData()
+schema_version = Table('schema_version', version_metadata, Column('version', Integer, nullable=False))
+
+
+def _baseline(connection):
+    """Every model table plus the chat search index"""
+    from app import db, chat_search
+    from app import models  # noqa: F401 -- registers the tables on db.metadata
+    db.metadata.create_all(connection)
+    chat_search.ensure_index(connection)
+
+
+MIGRATIONS = [
+    _baseline,
+]
+SCHEMA_VERSION = len(MIGRATIONS)
+
+
+def current_version(engine):
+    """The recorded schema version, or 0 for a database that has none"""
+    with engine.connect() as connection:
+        try:
+            return connection.execute(select(schema_version.c.version)).scalar() or 0
+        except exc.DBAPIError:
+            connection.rollback()
+            if inspect(connection).has_table(schema_version.name):
+                raise
+            return 0
+
+
+def upgrade(engine):
+    """Run the migrations the database hasn't had; returns the old version"""
+    with engine.begin() as connection:
+        version_metadata.create_all(connection)
+        version = connection.execute(select(schema_version.c.version)).scalar() or 0
+        if version >= SCHEMA_VERSION:
+            return version
+        for number, migration in enumerate(MIGRATIONS[version:], start=version + 1):
+            logger.info('Applying schema migration %d (%s)', number, migration.__name__)
+            migration(connection)
+        connection.execute(schema_version.delete())
+        connection.execute(schema_version.insert().values(version=SCHEMA_VERSION))
+    return version
+
+
+def ensure_schema(app):
+    """Bring the database up to SCHEMA_VERSION as DB_SCHEMA_CHECK says"""
+    from app import db
+    check = app.config['DB_SCHEMA_CHECK']
+    if check not in SCHEMA_CHECKS:
+        raise ValueError(f'DB_SCHEMA_CHECK must be one of {", ".join(SCHEMA_CHECKS)}')
+    if check == 'off':
+        return
+
+    with app.app_context():
+        version = current_version(db.engine)
+        if version == SCHEMA_VERSION:
+            return
+        if version > SCHEMA_VERSION:
+            # Newer code already migrated this database (e.g. mid rolling deploy)
+            logger.warning('Database schema version %d is newer than this code (%d)', version, SCHEMA_VERSION)
+            return
+        if check == 'verify':
+            raise RuntimeError(f'Database schema version {version} is behind {SCHEMA_VERSION}; '
+                               'run `flask upgrade-db`')
+        try:
+            upgrade(db.engine)
+        except exc.DBAPIError:
+            # Another worker booting at the same time may have just done it
+            if current_version(db.engine) < SCHEMA_VERSION:
+                raise
+
+
+@click.command('upgrade-db')
+@with_appcontext
+def upgrade_db_command():
+    """Apply pending schema migrations."""
+    from app import db
+    old = upgrade(db.engine)
+    if old >= SCHEMA_VERSION:
+        click.echo(f'Schema is current (version {old}).')
+    else:
+        click.echo(f'Schema upgraded from version {old} to {SCHEMA_VERSION}.')
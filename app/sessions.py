@@ -0,0 +1,255 @@
+"""
+Server-side sessions
+
+The session cookie holds only a short random ID; the session data lives in
+a store shared by every node (Redis, or a memory:// stand-in) or, for a
+single node, in files. Sessions can be revoked server-side, one at a time or
+all of a user's at once.
+
+Sessions load lazily: a request that never reads the session never touches
+the store, and a request that doesn't change it never writes back.
+"""
+
+import glob
+import json
+import os
+import secrets
+import tempfile
+import time
+
+from flask.json.tag import TaggedJSONSerializer
+from flask.sessions import SecureCookieSessionInterface, SessionInterface, SessionMixin
+
+from app.redis_client import get_redis
+
+SESSION_TYPES = ('redis', 'filesystem', 'cookie')
+
+# Flask-Login sets and pops '_remember' within one request, so it is never
+# stored; checking for it on a session that hasn't been read needn't load it.
+TRANSIENT_KEYS = frozenset({'_remember'})
+
+serializer = TaggedJSONSerializer()
+
+
+class ServerSession(SessionMixin):
+    """Session dict that loads from the store on first access"""
+
+    def __init__(self, store, sid=None):
+        self.store = store
+        self.sid = sid
+        self.new = sid is None
+        self.modified = False
+        self.accessed = False
+        self._data = None
+        self._loaded_user = None
+
+    def _load(self):
+        if self._data is None:
+            self.accessed = True
+            self._data = self.store.get(self.sid) if self.sid else None
+            if self._data is None:
+                # Unknown, expired or revoked: start over with a fresh ID
+                self._data, self.new = {}, True
+            self._loaded_user = self._data.get('_user_id')
+        return self._data
+
+    def __getitem__(self, key):
+        return self._load()[key]
+
+    def __setitem__(self, key, value):
+        self._load()[key] = value
+        self.modified = True
+
+    def __delitem__(self, key):
+        del self._load()[key]
+        self.modified = True
+
+    def __contains__(self, key):
+        if self._data is None and key in TRANSIENT_KEYS:
+            return False
+        return key in self._load()
+
+    def __iter__(self):
+        return iter(self._load())
+
+    def __len__(self):
+        return len(self._load())
+
+    def clear(self):
+        self._load().clear()
+        self.modified = True
+
+
+class RedisSessionStore:
+    """Sessions in Redis (or a memory:// LocalRedis stand-in), indexed by user"""
+
+    def __init__(self, client, prefix='session'):
+        self.redis = client
+        self.prefix = prefix
+
+    def _key(self, *parts):
+        return ':'.join((self.prefix,) + tuple(str(p) for p in parts))
+
+    def get(self, sid):
+        value = self.redis.get(self._key('sid', sid))
+        return serializer.loads(value) if value else None
+
+    def set(self, sid, data, ttl, user_id=None):
+        ttl = max(1, int(ttl))
+        pipe = self.redis.pipeline()
+        pipe.set(self._key('sid', sid), serializer.dumps(data), ex=ttl)
+        if user_id is not None:
+            pipe.sadd(self._key('user', user_id), sid)
+            pipe.expire(self._key('user', user_id), ttl)
+        pipe.execute()
+
+    def delete(self, sid):
+        self.redis.delete(self._key('sid', sid))
+
+    def revoke_user(self, user_id):
+        """Delete every session belonging to user_id; returns how many"""
+        index = self._key('user', user_id)
+        sids = self.redis.smembers(index)
+        removed = self.redis.delete(*[self._key('sid', sid) for sid in sids]) if sids else 0
+        self.redis.delete(index)
+        return removed
+
+
+class FilesystemSessionStore:
+    """One file per session, for single-node setups"""
+
+    def __init__(self, directory):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def _path(self, sid):
+        return os.path.join(self.directory, sid)
+
+    def _read(self, path):
+        try:
+            with open(path) as f:
+                record = json.load(f)
+        except (OSError, ValueError):
+            return None
+        if record['expires'] <= time.time():
+            self._remove(path)
+            return None
+        return record
+
+    def _remove(self, path):
+        try:
+            os.remove(path)
+        except OSError:
+            pass
+
+    def get(self, sid):
+        record = self._read(self._path(sid))
+        return serializer.loads(record['data']) if record else None
+
+    def set(self, sid, data, ttl, user_id=None):
+        record = {
+            'expires': time.time() + ttl,
+            'user_id': user_id,
+            'data': serializer.dumps(data)
+        }
+        # Write then rename so readers never see half a file
+        fd, tmp = tempfile.mkstemp(dir=self.directory, prefix='.tmp-')
+        with os.fdopen(fd, 'w') as f:
+            json.dump(record, f)
+        os.replace(tmp, self._path(sid))
+
+    def delete(self, sid):
+        self._remove(self._path(sid))
+
+    def revoke_user(self, user_id):
+        """Delete every session belonging to user_id (scans all sessions)"""
+        removed = 0
+        for path in glob.glob(os.path.join(self.directory, '[!.]*')):
+            record = self._read(path)
+            if record and record['user_id'] == str(user_id):
+                self._remove(path)
+                removed += 1
+        return removed
+
+
+class ServerSessionInterface(SessionInterface):
+    """Keeps session data in a store and only an ID in the cookie"""
+
+    def __init__(self, store):
+        self.store = store
+
+    def generate_sid(self):
+        """128 random bits as 22 URL-safe characters"""
+        return secrets.token_urlsafe(16)
+
+    def open_session(self, app, request):
+        sid = request.cookies.get(self.get_cookie_name(app))
+        return ServerSession(self.store, sid or None)
+
+    def save_session(self, app, session, response):
+        name = self.get_cookie_name(app)
+        domain = self.get_cookie_domain(app)
+        path = self.get_cookie_path(app)
+
+        if session.accessed:
+            response.vary.add('Cookie')
+        if not session.modified:
+            return
+
+        if not session:
+            # Emptied (e.g. logout): forget it on the server and the client
+            if session.sid:
+                self.store.delete(session.sid)
+                response.delete_cookie(name, domain=domain, path=path)
+            return
+
+        user_id = session.get('_user_id')
+        if session.new or user_id != session._loaded_user:
+            # New session, or the user changed (login/logout): issue a new ID
+            # so an ID known before login can't be used after it
+            if session.sid and not session.new:
+                self.store.delete(session.sid)
+            session.sid = self.generate_sid()
+
+        self.store.set(session.sid, dict(session), app.permanent_session_lifetime.total_seconds(), user_id)
+        response.set_cookie(
+            name, session.sid,
+            expires=self.get_expiration_time(app, session),
+            httponly=self.get_cookie_httponly(app),
+            domain=domain,
+            path=path,
+            secure=self.get_cookie_secure(app),
+            samesite=self.get_cookie_samesite(app)
+        )
+
+
+class SessionStore:
+    """Wires the configured session backend into the app"""
+
+    def __init__(self, app=None):
+        self.store = None
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Install the session interface for SESSION_TYPE"""
+        session_type = app.config['SESSION_TYPE']
+        if session_type not in SESSION_TYPES:
+            raise ValueError(f'SESSION_TYPE must be one of {", ".join(SESSION_TYPES)}')
+
+        if session_type == 'redis':
+            self.store = RedisSessionStore(get_redis(app.config['SESSION_REDIS_URL']))
+        elif session_type == 'filesystem':
+            self.store = FilesystemSessionStore(app.config['SESSION_FILE_DIR'])
+        else:
+            self.store = None
+
+        app.session_interface = (ServerSessionInterface(self.store) if self.store
+                                 else SecureCookieSessionInterface())
+        app.extensions['session_store'] = self
+
+    def revoke_user(self, user_id):
+        """Sign user_id out everywhere; returns the number of sessions removed"""
+        if self.store is None:
+            return 0
+        return self.store.revoke_user(user_id)
@@ -0,0 +1,207 @@
+"""
+Support agent queue
+
+Customers waiting for a human sit in a priority queue (highest priority first,
+then longest waiting). Agents register with a capacity and every waiting
+session goes to the least-loaded agent that still has room. When an agent
+disconnects their sessions go back to the front of the queue.
+
+Both the waiting queue and the agent pool are heaps with lazy deletion, so
+enqueueing, cancelling and assigning stay O(log n) with thousands waiting.
+"""
+
+import heapq
+import itertools
+import math
+import threading
+import time
+from collections import deque
+
+
+class SupportQueue:
+    """Priority queue of waiting sessions plus a load-aware agent pool"""
+
+    def __init__(self, app=None, clock=time.monotonic, wait_samples=1000):
+        self.clock = clock
+        self.default_capacity = 3
+        self._lock = threading.Lock()
+        self._seq = itertools.count()
+        self._wait_samples = wait_samples
+        self.reset()
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        """Read the default agent capacity from the app config"""
+        self.default_capacity = app.config['SUPPORT_AGENT_DEFAULT_CAPACITY']
+        self.reset()
+        app.extensions['support_queue'] = self
+
+    def reset(self):
+        """Drop every agent, waiting session and wait-time sample"""
+        with self._lock:
+            self._waiting = {}      # session_id -> entry [sort key..., session_id, info, live]
+            self._queue = []        # heap of entries
+            self._agents = {}       # agent_id -> {'name', 'capacity', 'sessions', 'version'}
+            self._agent_heap = []   # (load ratio, load, seq, version, agent_id)
+            self._assigned = {}     # session_id -> agent_id
+            self._assigned_info = {}  # session_id -> info from the original request
+            self._waits = deque(maxlen=self._wait_samples)
+
+    # -- agents ------------------------------------------------------------
+
+    def _push_agent(self, agent_id):
+        agent = self._agents[agent_id]
+        agent['version'] += 1
+        load = len(agent['sessions'])
+        if load < agent['capacity']:
+            heapq.heappush(self._agent_heap, (load / agent['capacity'], load, next(self._seq),
+                                              agent['version'], agent_id))
+
+    def _pop_agent(self):
+        """Least-loaded agent with spare capacity, or None"""
+        while self._agent_heap:
+            _, _, _, version, agent_id = heapq.heappop(self._agent_heap)
+            agent = self._agents.get(agent_id)
+            if agent is not None and agent['version'] == version:
+                return agent_id
+        return None
+
+    def register_agent(self, agent_id, name, capacity=None):
+        """Add (or update) an agent; returns any new assignments"""
+        capacity = self.default_capacity if capacity is None else capacity
+        with self._lock:
+            agent = self._agents.get(agent_id)
+            if agent is None:
+                agent = self._agents[agent_id] = {'name': name, 'sessions': set(), 'version': 0}
+            agent['name'] = name
+            agent['capacity'] = max(1, int(capacity))
+            self._push_agent(agent_id)
+            return self._dispatch()
+
+    def unregister_agent(self, agent_id):
+        """Remove an agent and requeue their sessions; returns new assignments"""
+        with self._lock:
+            agent = self._agents.pop(agent_id, None)
+            if agent is None:
+                return []
+            for session_id in agent['sessions']:
+                info = self._assigned_info.pop(session_id, {})
+                self._assigned.pop(session_id, None)
+                # Orphaned customers keep their place instead of starting over
+                self._enqueue(session_id, info.get('priority', 0), info.get('enqueued_at'), info)
+            return self._dispatch()
+
+    def is_agent(self, agent_id):
+        with self._lock:
+            return agent_id in self._agents
+
+    # -- sessions ------------------------------------------------------------
+
+    def _enqueue(self, session_id, priority, enqueued_at, info):
+        enqueued_at = self.clock() if enqueued_at is None else enqueued_at
+        info = dict(info, priority=priority, enqueued_at=enqueued_at)
+        # Oldest first within a priority; (-priority, enqueued_at) orders the heap
+        entry = [-priority, enqueued_at, next(self._seq), session_id, info, True]
+        self._waiting[session_id] = entry
+        heapq.heappush(self._queue, entry)
+
+    def request(self, session_id, priority=0, **info):
+        """Queue a session for an agent; returns new assignments"""
+        with self._lock:
+            if session_id in self._waiting or session_id in self._assigned:
+                return []
+            self._enqueue(session_id, priority, None, info)
+            return self._dispatch()
+
+    def cancel(self, session_id):
+        """Stop waiting (customer left); True if the session was queued"""
+        with self._lock:
+            entry = self._waiting.pop(session_id, None)
+            if entry is None:
+                return False
+            entry[-1] = False
+            return True
+
+    def release(self, session_id):
+        """An agent finished with a session; returns new assignments"""
+        with self._lock:
+            agent_id = self._assigned.pop(session_id, None)
+            if agent_id is None:
+                return []
+            self._assigned_info.pop(session_id, None)
+            agent = self._agents.get(agent_id)
+            if agent is not None:
+                agent['sessions'].discard(session_id)
+                self._push_agent(agent_id)
+            return self._dispatch()
+
+    def agent_for(self, session_id):
+        with self._lock:
+            return self._assigned.get(session_id)
+
+    def _dispatch(self):
+        """Match waiting sessions to agents until one side runs out"""
+        assignments = []
+        while self._waiting:
+            agent_id = self._pop_agent()
+            if agent_id is None:
+                break
+            entry = heapq.heappop(self._queue)
+            while not entry[-1]:
+                entry = heapq.heappop(self._queue)
+            session_id, info = entry[3], entry[4]
+            del self._waiting[session_id]
+
+            agent = self._agents[agent_id]
+            agent['sessions'].add(session_id)
+            self._assigned[session_id] = agent_id
+            self._assigned_info[session_id] = info
+            self._push_agent(agent_id)
+
+            wait = self.clock() - info['enqueued_at']
+            self._waits.append(wait)
+            assignments.append({
+                'session_id': session_id,
+                'agent_id': agent_id,
+                'agent_name': agent['name'],
+                'wait': wait,
+                'info': info
+            })
+
+        # Cancelled entries pile up at the top of the heap; shed them early
+        while self._queue and not self._queue[0][-1]:
+            heapq.heappop(self._queue)
+        return assignments
+
+    # -- reporting -------------------------------------------------------------
+
+    def stats(self):
+        """Queue depth, agent load and wait-time percentiles (seconds)"""
+        with self._lock:
+            waits = sorted(self._waits)
+            now = self.clock()
+            oldest = min((e[1] for e in self._waiting.values()), default=None)
+            return {
+                'waiting': len(self._waiting),
+                'assigned': len(self._assigned),
+                'oldest_wait': round(now - oldest, 3) if oldest is not None else 0,
+                'agents': [
+                    {'id': agent_id, 'name': a['name'], 'load': len(a['sessions']), 'capacity': a['capacity']}
+                    for agent_id, a in sorted(self._agents.items())
+                ],
+                'wait_percentiles': {
+                    'p50': _percentile(waits, 50),
+                    'p90': _percentile(waits, 90),
+                    'p99': _percentile(waits, 99)
+                },
+                'samples': len(waits)
+            }
+
+
+def _percentile(ordered, pct):
+    """Nearest-rank percentile of an already sorted list"""
+    if not ordered:
+        return 0
+    rank = max(1, math.ceil(pct / 100.0 * len(ordered)))
+    return round(ordered[rank - 1], 3)
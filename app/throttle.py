@@ -0,0 +1,212 @@
+"""
+Coalescing and rate limiting for high-frequency Socket.IO events
+
+An EventThrottle keeps the last state broadcast for each key (for example a
+user in a room) and only lets a change through once per interval. Changes
+that arrive too soon are held and sent when the interval ends, repeats of the
+current state are dropped, and keys that stop reporting fall back to an idle
+state (e.g. "stopped typing") after idle_timeout.
+"""
+
+import threading
+import time
+from functools import wraps
+
+from flask import request
+
+_UNSET = object()
+
+
+class _KeyState:
+    __slots__ = ('emitted', 'emitted_at', 'pending', 'last_seen', 'emit')
+
+    def __init__(self, idle_value):
+        self.emitted = idle_value
+        self.emitted_at = float('-inf')
+        self.pending = _UNSET
+        self.last_seen = 0.0
+        self.emit = None
+
+
+class EventThrottle:
+    """Per-key coalescing of state changes with an optional idle timeout"""
+
+    def __init__(self, name, socketio, interval=0.5, idle_timeout=None, idle_value=None,
+                 clock=time.monotonic):
+        self.name = name
+        self.socketio = socketio
+        self.interval = interval
+        self.idle_timeout = idle_timeout
+        self.idle_value = idle_value
+        self.clock = clock
+        self._lock = threading.Lock()
+        self._sweeper_started = False
+        self.reset()
+
+    def reset(self):
+        """Forget all keys and counters"""
+        with self._lock:
+            self._keys = {}
+            self._stats = {'received': 0, 'emitted': 0, 'deferred': 0, 'idle_timeouts': 0}
+
+    def submit(self, key, value, emit):
+        """
+        Report the current state for key. emit(value) is called now if the
+        change may go out immediately, or later by the sweeper. Returns True
+        if it was emitted now.
+        """
+        with self._lock:
+            now = self.clock()
+            self._stats['received'] += 1
+            state = self._keys.get(key)
+            if state is None:
+                state = self._keys[key] = _KeyState(self.idle_value)
+            state.last_seen = now
+            state.emit = emit
+
+            current = state.emitted if state.pending is _UNSET else state.pending
+            if value == current:
+                return False
+            if value == state.emitted:
+                # Flicker (on -> off -> on) inside one interval: nothing to send
+                state.pending = _UNSET
+                return False
+            if now - state.emitted_at < self.interval:
+                state.pending = value
+                send = False
+            else:
+                state.emitted, state.emitted_at, state.pending = value, now, _UNSET
+                self._stats['emitted'] += 1
+                send = True
+
+        if send:
+            emit(value)
+        self._ensure_sweeper()
+        return send
+
+    def allow(self, key):
+        """Plain rate limit: True at most once per interval for key"""
+        with self._lock:
+            now = self.clock()
+            self._stats['received'] += 1
+            state = self._keys.get(key)
+            if state is None:
+                state = self._keys[key] = _KeyState(self.idle_value)
+            state.last_seen = now
+            if now - state.emitted_at < self.interval:
+                return False
+            state.emitted_at = now
+            self._stats['emitted'] += 1
+        self._ensure_sweeper()
+        return True
+
+    def drop(self, key):
+        """Forget key, sending the idle state first if it is not idle already"""
+        with self._lock:
+            state = self._keys.pop(key, None)
+            send = state is not None and state.emit is not None and state.emitted != self.idle_value
+            if send:
+                self._stats['emitted'] += 1
+                self._stats['idle_timeouts'] += 1
+        if send:
+            state.emit(self.idle_value)
+
+    def drop_matching(self, predicate):
+        """drop() every key for which predicate(key) is true"""
+        with self._lock:
+            keys = [key for key in self._keys if predicate(key)]
+        for key in keys:
+            self.drop(key)
+
+    def sweep(self):
+        """Send held changes whose interval has passed and expire idle keys"""
+        due = []
+        with self._lock:
+            now = self.clock()
+            linger = max(self.interval, self.idle_timeout or 0) * 2
+            for key, state in list(self._keys.items()):
+                if state.pending is not _UNSET and now - state.emitted_at >= self.interval:
+                    state.emitted, state.emitted_at = state.pending, now
+                    state.pending = _UNSET
+                    self._stats['emitted'] += 1
+                    self._stats['deferred'] += 1
+                    due.append((state.emit, state.emitted))
+                elif (self.idle_timeout is not None and state.pending is _UNSET
+                        and state.emitted != self.idle_value
+                        and now - state.last_seen >= self.idle_timeout):
+                    state.emitted, state.emitted_at = self.idle_value, now
+                    self._stats['emitted'] += 1
+                    self._stats['idle_timeouts'] += 1
+                    due.append((state.emit, state.emitted))
+                elif (state.pending is _UNSET and state.emitted == self.idle_value
+                        and now - state.last_seen >= linger):
+                    del self._keys[key]
+
+        for emit, value in due:
+            if emit is not None:
+                emit(value)
+        return len(due)
+
+    def stats(self):
+        """Counters, including how many received events were never broadcast"""
+        with self._lock:
+            stats = dict(self._stats, keys=len(self._keys))
+        from_events = stats['emitted'] - stats['idle_timeouts']
+        stats['suppressed'] = max(0, stats['received'] - from_events)
+        return stats
+
+    def _ensure_sweeper(self):
+        with self._lock:
+            if self._sweeper_started:
+                return
+            self._sweeper_started = True
+        self.socketio.start_background_task(self._run)
+
+    def _run(self):
+        tick = min(self.interval, self.idle_timeout or self.interval) / 2
+        while True:
+            self.socketio.sleep(tick)
+            self.sweep()
+
+
+class EventThrottles:
+    """Named throttles configured from SOCKETIO_EVENT_THROTTLES"""
+
+    def __init__(self, socketio, app=None):
+        self.socketio = socketio
+        self._throttles = {}
+        if app is not None:
+            self.init_app(app)
+
+    def init_app(self, app):
+        for name, options in app.config['SOCKETIO_EVENT_THROTTLES'].items():
+            throttle = self._throttles.get(name)
+            if throttle is None:
+                throttle = self._throttles[name] = EventThrottle(name, self.socketio)
+            throttle.interval = options.get('interval', throttle.interval)
+            throttle.idle_timeout = options.get('idle_timeout')
+            throttle.idle_value = options.get('idle_value')
+            throttle.reset()
+        app.extensions['event_throttles'] = self
+
+    def get(self, name):
+        return self._throttles[name]
+
+    def stats(self):
+        return {name: throttle.stats() for name, throttle in self._throttles.items()}
+
+
+def throttled(throttles, name, key=None):
+    """
+    Decorator for Socket.IO handlers that drops events arriving more than once
+    per interval for the same key (default: the client's sid).
+    """
+    def decorator(handler):
+        @wraps(handler)
+        def wrapped(*args, **kwargs):
+            throttle_key = key(*args) if key else request.sid
+            if not throttles.get(name).allow(throttle_key):
+                return None
+            return handler(*args, **kwargs)
+        return wrapped
+    return decorator
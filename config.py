@@ -9,9 +9,28 @@ class Config:
     SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL', 'sqlite:///ecommerce.db')
     SQLALCHEMY_TRACK_MODIFICATIONS = False
     
+    # Connection pool (not used for in-memory SQLite). Anything set in
+    # SQLALCHEMY_ENGINE_OPTIONS overrides the values built from these.
+    SQLALCHEMY_ENGINE_OPTIONS = {}
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 10))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 30))  # seconds to wait for a free connection
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', -1))  # seconds before a connection is replaced
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'false').lower() == 'true'
+    # Startup schema check: 'upgrade' migrates an out-of-date database, 'verify'
+    # refuses to start (run `flask upgrade-db` on deploy instead), 'off' skips it
+    DB_SCHEMA_CHECK = os.getenv('DB_SCHEMA_CHECK', 'upgrade')
+    # Under eventlet, let psycopg2 yield to other green threads while waiting on PostgreSQL
+    DB_EVENTLET_PSYCOPG2 = os.getenv('DB_EVENTLET_PSYCOPG2', 'true').lower() == 'true'
+    
     # Redis for session management across multiple servers (optional for SQLite mode)
     REDIS_URL = os.getenv('REDIS_URL', None)
-    SESSION_TYPE = 'filesystem'  # Use filesystem sessions instead of Redis
+    
+    # Server-side sessions: 'filesystem' (single node), 'redis' (shared by every node;
+    # SESSION_REDIS_URL may be memory://name for an in-process stand-in) or 'cookie'
+    SESSION_TYPE = os.getenv('SESSION_TYPE', 'filesystem')
+    SESSION_REDIS_URL = os.getenv('SESSION_REDIS_URL', REDIS_URL)
+    SESSION_FILE_DIR = os.getenv('SESSION_FILE_DIR', 'flask_session')
     
     # Server identification
     SERVER_NAME_ID = os.getenv('SERVER_NAME', 'Server-1')
@@ -20,22 +39,129 @@ class Config:
     UPLOAD_FOLDER = 'static/uploads'
     MAX_CONTENT_LENGTH = 16 * 1024 * 1024  # 16MB max file size
     
-    # Socket.IO Configuration (works without Redis in single-server mode)
-    SOCKETIO_MESSAGE_QUEUE = None
+    # Socket.IO Configuration (works without Redis in single-server mode).
+    # Set SOCKETIO_MESSAGE_QUEUE (e.g. redis://localhost:6379/1) so rooms span every node.
+    SOCKETIO_MESSAGE_QUEUE = os.getenv('SOCKETIO_MESSAGE_QUEUE', None)
     SOCKETIO_CORS_ALLOWED_ORIGINS = "*"
+    # None picks eventlet when installed; 'threading' avoids importing eventlet at all
+    SOCKETIO_ASYNC_MODE = os.getenv('SOCKETIO_ASYNC_MODE') or None
+    
+    # Request/Socket.IO latency metrics served at /metrics (Prometheus text format)
+    METRICS_ENABLED = os.getenv('METRICS_ENABLED', 'true').lower() == 'true'
+    METRICS_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)  # seconds
+    
+    # SQL instrumentation: per-request query count/time, slow-query log, N+1 detection.
+    # X-Query-* debug headers default to on in debug mode only.
+    SQL_INSTRUMENTATION = os.getenv('SQL_INSTRUMENTATION', 'true').lower() == 'true'
+    SQL_SLOW_QUERY_MS = float(os.getenv('SQL_SLOW_QUERY_MS', 100))
+    SQL_N_PLUS_ONE_THRESHOLD = int(os.getenv('SQL_N_PLUS_ONE_THRESHOLD', 5))  # same statement this often per request
+    SQL_DEBUG_HEADERS = None
+    
+    # Server-side throttling of high-frequency Socket.IO events. 'typing' state is
+    # coalesced per user per room; other entries rate-limit an event per client.
+    SOCKETIO_EVENT_THROTTLES = {
+        'typing': {
+            'interval': float(os.getenv('TYPING_THROTTLE_INTERVAL', 0.5)),  # max one state change per interval
+            'idle_timeout': float(os.getenv('TYPING_IDLE_TIMEOUT', 3.0)),  # auto "stopped typing" after this
+            'idle_value': False
+        },
+        'support_request': {'interval': 30.0}
+    }
+    
+    # Support agents: concurrent chats per agent unless they register with their own capacity
+    SUPPORT_AGENT_DEFAULT_CAPACITY = int(os.getenv('SUPPORT_AGENT_DEFAULT_CAPACITY', 3))
+    
+    # Chat session registry / presence: 'memory' (this process) or 'redis' (cluster-wide).
+    # CHAT_PRESENCE_REDIS_URL may be memory://name for an in-process stand-in.
+    CHAT_PRESENCE_BACKEND = os.getenv('CHAT_PRESENCE_BACKEND', 'memory')
+    CHAT_PRESENCE_REDIS_URL = os.getenv('CHAT_PRESENCE_REDIS_URL', REDIS_URL)
+    
+    # Signed-in user cache for Flask-Login: 'memory' (per process, bounded LRU) or
+    # 'redis' (shared, so invalidation reaches every node). TTL 0 disables it.
+    IDENTITY_CACHE_BACKEND = os.getenv('IDENTITY_CACHE_BACKEND', 'memory')
+    IDENTITY_CACHE_REDIS_URL = os.getenv('IDENTITY_CACHE_REDIS_URL', REDIS_URL)
+    IDENTITY_CACHE_TTL = float(os.getenv('IDENTITY_CACHE_TTL', 60))
+    IDENTITY_CACHE_MAX_SIZE = int(os.getenv('IDENTITY_CACHE_MAX_SIZE', 10000))
+    
+    # Password hashing: Werkzeug method string (algorithm and cost), e.g.
+    # scrypt:32768:8:1 or pbkdf2:sha256:600000. Older hashes are upgraded on login.
+    # Executor: auto (eventlet tpool under eventlet, else threads), tpool, thread, process or inline.
+    PASSWORD_HASH_METHOD = os.getenv('PASSWORD_HASH_METHOD', 'scrypt:32768:8:1')
+    PASSWORD_HASH_EXECUTOR = os.getenv('PASSWORD_HASH_EXECUTOR', 'auto')
+    PASSWORD_HASH_WORKERS = int(os.getenv('PASSWORD_HASH_WORKERS', 4))  # concurrent hashes; leave a core for the event loop
+    
+    # Token-bucket rate limits: up to `burst` at once, refilled at `rate` per `per` seconds.
+    # Backend 'memory' (per process) or 'redis' (shared by every node).
+    RATE_LIMIT_ENABLED = os.getenv('RATE_LIMIT_ENABLED', 'true').lower() == 'true'
+    RATE_LIMIT_BACKEND = os.getenv('RATE_LIMIT_BACKEND', 'memory')
+    RATE_LIMIT_REDIS_URL = os.getenv('RATE_LIMIT_REDIS_URL', REDIS_URL)
+    RATE_LIMITS = {
+        'login_ip': {'rate': 20, 'per': 60, 'burst': 10},      # per client IP
+        'login_user': {'rate': 5, 'per': 60, 'burst': 5},      # per username attempted
+        'register_ip': {'rate': 5, 'per': 60, 'burst': 5},
+        'cart': {'rate': 60, 'per': 60, 'burst': 20},          # cart writes per user
+        'checkout': {'rate': 5, 'per': 60, 'burst': 3},        # per user
+        'chat_message': {'rate': 2, 'per': 1, 'burst': 10}     # per Socket.IO connection
+    }
+    
+    # Delay before the support bot replies (simulates typing, never blocks the handler)
+    CHAT_BOT_REPLY_DELAY = float(os.getenv('CHAT_BOT_REPLY_DELAY', 1.0))
+    
+    # Chat history paging (messages sent on join / per load_older request)
+    CHAT_HISTORY_PAGE_SIZE = int(os.getenv('CHAT_HISTORY_PAGE_SIZE', 50))
+    CHAT_HISTORY_MAX_PAGE_SIZE = 200
+    CHAT_SEARCH_PAGE_SIZE = int(os.getenv('CHAT_SEARCH_PAGE_SIZE', 20))
+    CHAT_SEARCH_MAX_PAGE_SIZE = 100
+    
+    # Write-behind chat persistence: flush every N messages or M milliseconds
+    CHAT_WRITE_BEHIND = os.getenv('CHAT_WRITE_BEHIND', 'true').lower() == 'true'
+    CHAT_WRITER_BATCH_SIZE = int(os.getenv('CHAT_WRITER_BATCH_SIZE', 100))
+    CHAT_WRITER_FLUSH_INTERVAL_MS = int(os.getenv('CHAT_WRITER_FLUSH_INTERVAL_MS', 200))
+    CHAT_WRITER_MAX_BUFFER = int(os.getenv('CHAT_WRITER_MAX_BUFFER', 5000))  # producers flush inline beyond this
+    CHAT_WRITER_FLUSH_ON_SHUTDOWN = os.getenv('CHAT_WRITER_FLUSH_ON_SHUTDOWN', 'true').lower() == 'true'
+    
+    # Support bot intents: this JSON file (or built-in defaults), overridden by the chat_intents table
+    CHAT_INTENTS_FILE = os.getenv('CHAT_INTENTS_FILE', None)
+    CHAT_INTENTS_RELOAD_INTERVAL = int(os.getenv('CHAT_INTENTS_RELOAD_INTERVAL', 30))  # seconds between change checks
+    
+    # Checkout admission control (virtual waiting room, per node)
+    CHECKOUT_MAX_CONCURRENT = int(os.getenv('CHECKOUT_MAX_CONCURRENT', 10))
+    CHECKOUT_MAX_QUEUE = int(os.getenv('CHECKOUT_MAX_QUEUE', 1000))
+    CHECKOUT_QUEUE_TOKEN_TTL = int(os.getenv('CHECKOUT_QUEUE_TOKEN_TTL', 30))  # seconds without polling
 
 class DevelopmentConfig(Config):
     """Development configuration"""
     DEBUG = True
     TESTING = False
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 5))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 5))
 
 class ProductionConfig(Config):
     """Production configuration"""
     DEBUG = False
     TESTING = False
+    # Per worker process: keep pool_size + max_overflow under the database's
+    # max_connections divided by the number of workers on all nodes
+    DB_POOL_SIZE = int(os.getenv('DB_POOL_SIZE', 20))
+    DB_MAX_OVERFLOW = int(os.getenv('DB_MAX_OVERFLOW', 30))
+    DB_POOL_TIMEOUT = int(os.getenv('DB_POOL_TIMEOUT', 10))  # fail fast rather than pile up requests
+    DB_POOL_RECYCLE = int(os.getenv('DB_POOL_RECYCLE', 1800))  # below server/proxy idle timeouts
+    DB_POOL_PRE_PING = os.getenv('DB_POOL_PRE_PING', 'true').lower() == 'true'
+
+class TestingConfig(Config):
+    """Testing configuration"""
+    DEBUG = False
+    TESTING = True
+    SQLALCHEMY_DATABASE_URI = 'sqlite:///:memory:'
+    SOCKETIO_MESSAGE_QUEUE = None  # The Socket.IO test client can't use a message queue
+    SOCKETIO_ASYNC_MODE = 'threading'  # Importing eventlet costs more than a test app's whole startup
+    PASSWORD_HASH_METHOD = 'pbkdf2:sha256:1000'  # Cheap hashes keep the suite fast
+    SESSION_TYPE = 'redis'
+    SESSION_REDIS_URL = 'memory://sessions'
 
 config = {
     'development': DevelopmentConfig,
     'production': ProductionConfig,
+    'testing': TestingConfig,
     'default': DevelopmentConfig
 }
@@ -0,0 +1,93 @@
+#!/usr/bin/env python3
+"""
+Benchmark chat message persistence
+Compares one commit per message (the old handle_send_message path) with the
+write-behind ChatWriter, against a throwaway SQLite file or DATABASE_URL.
+
+Usage: python deployment/chat_writer_benchmark.py [--messages 5000] [--batch-size 100]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import TestingConfig
+
+
+def make_row(i):
+    return {
+        'session_id': f'bench-{i % 50}',
+        'user_id': None,
+        'username': 'bench',
+        'message': f'benchmark message {i}',
+        'is_support': False,
+        'timestamp': datetime.utcnow()
+    }
+
+
+def bench_commit_per_message(db, ChatMessage, count):
+    """One INSERT + COMMIT per message"""
+    started = time.perf_counter()
+    for i in range(count):
+        db.session.add(ChatMessage(**make_row(i)))
+        db.session.commit()
+    return time.perf_counter() - started
+
+
+def bench_write_behind(chat_writer, count):
+    """Buffered rows flushed in batches, including the final drain"""
+    started = time.perf_counter()
+    for i in range(count):
+        chat_writer.submit(make_row(i))
+    chat_writer.flush()
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Chat persistence benchmark')
+    parser.add_argument('--messages', type=int, default=5000)
+    parser.add_argument('--batch-size', type=int, default=100)
+    args = parser.parse_args()
+
+    db_path = None
+    if os.getenv('DATABASE_URL'):
+        TestingConfig.SQLALCHEMY_DATABASE_URI = os.getenv('DATABASE_URL')
+    else:
+        db_path = os.path.join(tempfile.mkdtemp(), 'chat_bench.db')
+        TestingConfig.SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+    TestingConfig.CHAT_WRITER_BATCH_SIZE = args.batch_size
+    TestingConfig.CHAT_WRITER_MAX_BUFFER = args.batch_size * 10
+
+    from app import create_app, db, chat_writer
+    from app.models import ChatMessage
+
+    app = create_app('testing')
+    with app.app_context():
+        direct = bench_commit_per_message(db, ChatMessage, args.messages)
+        ChatMessage.query.delete()
+        db.session.commit()
+        batched = bench_write_behind(chat_writer, args.messages)
+        stored = ChatMessage.query.count()
+
+    print("="*50)
+    print("Chat Persistence Benchmark")
+    print("="*50)
+    print(f"  Database:               {app.config['SQLALCHEMY_DATABASE_URI']}")
+    print(f"  Messages:               {args.messages}")
+    print(f"  Commit per message:     {args.messages / direct:,.0f} msg/s")
+    print(f"  Write-behind (batch {args.batch_size}): {args.messages / batched:,.0f} msg/s")
+    print(f"  Speedup:                {direct / batched:.1f}x")
+    print(f"  Rows stored:            {stored}")
+
+    if db_path:
+        os.remove(db_path)
+    return 0 if stored == args.messages else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
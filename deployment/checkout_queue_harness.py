@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Local-only harness for the checkout waiting room
+Fires a burst of concurrent checkouts at an in-process app backed by a
+throwaway SQLite file and reports how the admission controller behaved.
+
+Usage: python deployment/checkout_queue_harness.py [--users 50] [--capacity 4]
+"""
+
+import argparse
+import os
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import TestingConfig
+
+
+def build_app(db_path, capacity):
+    """Create an app with its own database and a small checkout cap"""
+    TestingConfig.SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+    TestingConfig.CHECKOUT_MAX_CONCURRENT = capacity
+
+    from app import create_app, db
+    from app.models import User, Product
+
+    app = create_app('testing')
+    with app.app_context():
+        db.session.add(Product(name='Harness Product', price=10.0, category='Test',
+                               stock_quantity=100000))
+        db.session.commit()
+    return app, db, User
+
+
+def run_client(app, index, poll_interval):
+    """Register, fill the cart and keep retrying checkout until admitted"""
+    client = app.test_client()
+    client.post('/auth/register', json={
+        'username': f'harness{index}',
+        'email': f'harness{index}@example.com',
+        'password': 'password123'
+    })
+    client.post('/api/cart/add', json={'product_id': 1, 'quantity': 1})
+
+    started = time.perf_counter()
+    token = None
+    polls = 0
+    while True:
+        headers = {'X-Queue-Token': token} if token else {}
+        response = client.post('/api/checkout/process',
+                               json={'shipping_address': '1 Harness Way'},
+                               headers=headers)
+        polls += 1
+        if response.status_code != 503:
+            return response.status_code, time.perf_counter() - started, polls
+        if response.json.get('queued'):
+            token = response.json['queue_token']
+        time.sleep(poll_interval)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Checkout waiting room harness')
+    parser.add_argument('--users', type=int, default=50)
+    parser.add_argument('--capacity', type=int, default=4)
+    parser.add_argument('--poll-interval', type=float, default=0.01)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'harness.db')
+    app, db, _ = build_app(db_path, args.capacity)
+    from app import checkout_admission
+
+    peak = {'active': 0, 'queue_depth': 0}
+    stop = threading.Event()
+
+    def monitor():
+        while not stop.is_set():
+            status = checkout_admission.status()
+            peak['active'] = max(peak['active'], status['active'])
+            peak['queue_depth'] = max(peak['queue_depth'], status['queue_depth'])
+            time.sleep(0.001)
+
+    watcher = threading.Thread(target=monitor, daemon=True)
+    watcher.start()
+
+    with ThreadPoolExecutor(max_workers=args.users) as pool:
+        results = list(pool.map(lambda i: run_client(app, i, args.poll_interval),
+                                range(args.users)))
+    stop.set()
+    watcher.join()
+
+    waits = sorted(r[1] for r in results)
+    ok = sum(1 for r in results if r[0] == 201)
+    print("="*50)
+    print("Checkout Waiting Room Harness")
+    print("="*50)
+    print(f"  Clients:            {args.users}")
+    print(f"  Capacity per node:  {args.capacity}")
+    print(f"  Orders placed:      {ok}/{args.users}")
+    print(f"  Peak active:        {peak['active']} (cap {args.capacity})")
+    print(f"  Peak queue depth:   {peak['queue_depth']}")
+    print(f"  Total polls:        {sum(r[2] for r in results)}")
+    print(f"  Time to order p50:  {waits[len(waits) // 2] * 1000:.1f}ms")
+    print(f"  Time to order p95:  {waits[int(len(waits) * 0.95) - 1] * 1000:.1f}ms")
+    print(f"  Final status:       {checkout_admission.status()}")
+
+    os.remove(db_path)
+    return 0 if ok == args.users and peak['active'] <= args.capacity else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
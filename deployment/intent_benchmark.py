@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Micro-benchmark for the support bot intent matcher
+Compares the original chain of substring scans, an equivalent chain of
+per-intent word-boundary regexes (one pass per intent) and the compiled
+single-pass engine over a corpus of typical customer chat messages.
+
+Note that the original chain is not a like-for-like baseline: substring
+matching lets 'hi' fire inside 'this' or 'shipping', so it usually stops at
+the first rule. The per-intent regex chain gives the same answers as the
+compiled engine and shows the cost of scanning the message once per intent.
+
+Usage: python deployment/intent_benchmark.py [--rounds 2000]
+"""
+
+import argparse
+import os
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from app.intents import CompiledIntents, DEFAULT_INTENTS
+
+CORPUS = [
+    "Hi, I placed an order yesterday and haven't received a confirmation email",
+    "hello",
+    "Where is my order? The tracking number doesn't work",
+    "I want to return the shoes I bought last week, they are too small",
+    "Can I get a refund instead of an exchange?",
+    "Do you accept PayPal or only credit cards at checkout?",
+    "My payment failed but the money was taken from my account",
+    "How long does shipping take to Canada?",
+    "Is express delivery available for this item?",
+    "Is the blue backpack back in stock?",
+    "When will the wireless headphones be available again",
+    "I need to cancel my order, I ordered the wrong size",
+    "Do you have any discount codes for first time customers?",
+    "The promo code SUMMER20 isn't working",
+    "Are there any deals on laptops this weekend?",
+    "I need help with my account password",
+    "Can someone from support call me back?",
+    "thanks a lot!",
+    "Thank you so much for your assistance",
+    "The product description says waterproof but it leaked",
+    "Can I change the shipping address after ordering?",
+    "What is your warranty policy on electronics?",
+    "my package says delivered but I never got it",
+    "Do you ship internationally and how much does it cost",
+    "I was charged twice for the same purchase",
+    "hey is anyone there",
+    "The item arrived damaged, what should I do",
+    "Can I pay with cash on delivery?",
+    "how do I use a gift card",
+    "Is there a student discount",
+    "I'd like to speak to a human please",
+    "What sizes are available for the running shoes?",
+    "Order #4821 still shows processing after 5 days",
+    "can i exchange a gift for store credit",
+    "Why was my order cancelled?",
+    "Do you price match other stores' offers?",
+    "The checkout page keeps showing an error",
+    "greetings, I have a question about bulk orders",
+    "ok thx",
+    "Is this jacket true to size?",
+]
+
+
+def legacy_auto_response(message):
+    """The original generate_auto_response keyword chain"""
+    message = message.lower()
+    if any(word in message for word in ['hello', 'hi', 'hey', 'greetings']):
+        return 'greeting'
+    elif any(word in message for word in ['order', 'track', 'tracking', 'delivery']):
+        return 'order_tracking'
+    elif any(word in message for word in ['return', 'refund', 'exchange']):
+        return 'returns'
+    elif any(word in message for word in ['payment', 'pay', 'checkout']):
+        return 'payment'
+    elif any(word in message for word in ['shipping', 'delivery', 'ship']):
+        return 'shipping'
+    elif any(word in message for word in ['product', 'item', 'stock', 'available']):
+        return 'availability'
+    elif any(word in message for word in ['cancel', 'cancellation']):
+        return 'cancellation'
+    elif any(word in message for word in ['discount', 'coupon', 'promo', 'offer']):
+        return 'promotions'
+    elif any(word in message for word in ['help', 'support', 'assistance']):
+        return 'help'
+    elif any(word in message for word in ['thank', 'thanks']):
+        return 'thanks'
+    return None
+
+
+def per_intent_chain(intents):
+    """One word-boundary regex per intent, tried in priority order"""
+    chain = []
+    for intent in sorted(intents, key=lambda i: i['priority'], reverse=True):
+        compiled = CompiledIntents([intent])
+        chain.append((compiled.pattern, intent))
+
+    def match(message):
+        for pattern, intent in chain:
+            if pattern.search(message):
+                return intent
+        return None
+    return match
+
+
+def timed(func, rounds):
+    started = time.perf_counter()
+    for _ in range(rounds):
+        for message in CORPUS:
+            func(message)
+    return (time.perf_counter() - started) / (rounds * len(CORPUS))
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Intent matcher micro-benchmark')
+    parser.add_argument('--rounds', type=int, default=2000)
+    args = parser.parse_args()
+
+    compiled = CompiledIntents(DEFAULT_INTENTS)
+    legacy = timed(legacy_auto_response, args.rounds)
+    chain = timed(per_intent_chain(DEFAULT_INTENTS), args.rounds)
+    engine = timed(compiled.match, args.rounds)
+
+    # Messages where whole-word matching changes the answer (e.g. 'hi' in 'this')
+    changed = []
+    for message in CORPUS:
+        intent = compiled.match(message)
+        new_name = intent['name'] if intent else None
+        old_name = legacy_auto_response(message)
+        if new_name != old_name:
+            changed.append((message, old_name, new_name))
+
+    print("="*50)
+    print("Intent Matcher Benchmark")
+    print("="*50)
+    print(f"  Corpus:             {len(CORPUS)} messages x {args.rounds} rounds")
+    print(f"  Substring chain:    {legacy * 1e6:.2f} us/message (original)")
+    print(f"  Per-intent regexes: {chain * 1e6:.2f} us/message")
+    print(f"  Compiled regex:     {engine * 1e6:.2f} us/message")
+    print(f"  Speedup vs per-intent: {chain / engine:.1f}x")
+    print(f"  Different answers:  {len(changed)}")
+    for message, old_name, new_name in changed:
+        print(f"    {message!r}: {old_name} -> {new_name}")
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
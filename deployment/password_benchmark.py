@@ -0,0 +1,120 @@
+#!/usr/bin/env python3
+"""
+Benchmark browse latency during a login storm
+Runs concurrent logins and a steady product-browsing loop on one eventlet
+hub (like a single eventlet worker), first with password hashing inline and
+then in the hashing pool, and reports browse latency for each.
+
+Usage: python deployment/password_benchmark.py [--logins 40] [--method scrypt:32768:8:1] [--workers 4]
+"""
+
+import argparse
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+import eventlet
+eventlet.monkey_patch()  # as an eventlet worker would run
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from config import TestingConfig
+
+
+def browse(client, latencies, done):
+    """
+    Fetch the product list every 10 ms until the storm is over. Latency is
+    measured from when the request was due, so time spent waiting for a
+    blocked hub counts, as it would for a real client.
+    """
+    due = time.perf_counter()
+    while not done:
+        client.get('/api/products/')
+        finished = time.perf_counter()
+        latencies.append((finished - due) * 1000)
+        due = finished + 0.01
+        eventlet.sleep(0.01)
+
+
+def login(app, username):
+    client = app.test_client()
+    response = client.post('/auth/login', json={'username': username, 'password': 'storm-password'})
+    assert response.status_code == 200, response.get_data(as_text=True)
+
+
+def run(app, executor, logins):
+    from app import password_hasher
+    password_hasher.executor = executor
+
+    latencies, done = [], []
+    browser = eventlet.spawn(browse, app.test_client(), latencies, done)
+    eventlet.sleep(0.05)
+    baseline = len(latencies)
+
+    started = time.perf_counter()
+    pool = eventlet.GreenPool(logins)
+    for i in range(logins):
+        pool.spawn(login, app, f'storm{i}')
+    pool.waitall()
+    elapsed = time.perf_counter() - started
+
+    done.append(True)
+    browser.wait()
+    storm = latencies[baseline:] or [0]
+    return {
+        'elapsed': elapsed,
+        'p50': statistics.median(storm),
+        'max': max(storm),
+        'requests': len(storm)
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Login storm benchmark')
+    parser.add_argument('--logins', type=int, default=40)
+    parser.add_argument('--method', default='scrypt:32768:8:1')
+    parser.add_argument('--workers', type=int, default=TestingConfig.PASSWORD_HASH_WORKERS)
+    args = parser.parse_args()
+
+    db_path = os.path.join(tempfile.mkdtemp(), 'password_bench.db')
+    TestingConfig.SQLALCHEMY_DATABASE_URI = f'sqlite:///{db_path}'
+    TestingConfig.PASSWORD_HASH_METHOD = args.method
+    TestingConfig.PASSWORD_HASH_WORKERS = args.workers
+    TestingConfig.SOCKETIO_ASYNC_MODE = 'eventlet'
+
+    from app import create_app, db
+    from app.models import User
+
+    app = create_app('testing')
+    with app.app_context():
+        template = User(username='template', email='template@example.com')
+        template.set_password('storm-password')
+        for i in range(args.logins):
+            db.session.add(User(username=f'storm{i}', email=f'storm{i}@example.com',
+                                password_hash=template.password_hash))
+        db.session.commit()
+
+    inline = run(app, 'inline', args.logins)
+    pooled = run(app, 'tpool', args.logins)
+
+    print("="*50)
+    print("Login Storm Benchmark")
+    print("="*50)
+    print(f"  Hash method:            {args.method}")
+    print(f"  Concurrent logins:      {args.logins}")
+    print(f"  Hashing workers:        {args.workers} ({os.cpu_count()} CPUs)")
+    for label, result in (('Inline hashing', inline), ('Hashing pool (tpool)', pooled)):
+        print(f"  {label}:")
+        print(f"    Storm duration:       {result['elapsed']:.2f}s")
+        print(f"    Browse requests:      {result['requests']}")
+        print(f"    Browse latency p50:   {result['p50']:.1f} ms")
+        print(f"    Browse latency max:   {result['max']:.1f} ms")
+
+    os.remove(db_path)
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
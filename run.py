@@ -1,3 +1,11 @@
+try:
+    # Before anything else: green threads then wait for pooled DB connections
+    # (and on sockets) cooperatively instead of blocking the whole worker
+    import eventlet
+    eventlet.monkey_patch()
+except ImportError:
+    pass
+
 from app import create_app, socketio
 import os
 
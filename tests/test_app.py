@@ -10,8 +10,22 @@ import os
 # Add project directory to path
 sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
 
-from app import create_app, db
-from app.models import User, Product, CartItem
+from app import create_app, db, socketio, checkout_admission, chat_writer, intent_engine, presence, identity_cache, rate_limiter, session_store
+from app.admission import AdmissionController
+from app.intents import CompiledIntents, DEFAULT_INTENTS, FALLBACK_RESPONSE
+from app.presence import PresenceRegistry, RedisPresenceBackend
+from app.redis_client import get_redis
+from app.throttle import EventThrottle
+from app.support_queue import SupportQueue
+from app.identity_cache import MemoryIdentityBackend, RedisIdentityBackend
+from app.passwords import PasswordHasher, normalize_method
+from app.rate_limit import MemoryRateLimitBackend, RedisRateLimitBackend
+from app.sessions import FilesystemSessionStore
+from app.metrics import Histogram, Metrics
+from app.query_stats import query_budget, track_queries
+from app.db_pool import InstrumentedQueuePool, engine_options
+from app.models import User, Product, CartItem, ChatMessage
+import time
 
 @pytest.fixture
 def app():
@@ -21,8 +35,8 @@ def app():
     app.config['SQLALCHEMY_DATABASE_URI'] = 'sqlite:///:memory:'
     
     with app.app_context():
-        db.create_all()
         yield app
+        chat_writer.flush()
         db.session.remove()
         db.drop_all()
 
@@ -34,31 +48,29 @@ def client(app):
 @pytest.fixture
 def sample_user(app):
     """Create a sample user"""
-    with app.app_context():
-        user = User(
-            username='testuser',
-            email='test@example.com',
-            full_name='Test User'
-        )
-        user.set_password('password123')
-        db.session.add(user)
-        db.session.commit()
-        return user
+    user = User(
+        username='testuser',
+        email='test@example.com',
+        full_name='Test User'
+    )
+    user.set_password('password123')
+    db.session.add(user)
+    db.session.commit()
+    return user
 
 @pytest.fixture
 def sample_product(app):
     """Create a sample product"""
-    with app.app_context():
-        product = Product(
-            name='Test Product',
-            description='Test Description',
-            price=99.99,
-            category='Test',
-            stock_quantity=10
-        )
-        db.session.add(product)
-        db.session.commit()
-        return product
+    product = Product(
+        name='Test Product',
+        description='Test Description',
+        price=99.99,
+        category='Test',
+        stock_quantity=10
+    )
+    db.session.add(product)
+    db.session.commit()
+    return product
 
 class TestAuth:
     """Test authentication endpoints"""
@@ -137,5 +149,823 @@ class TestCart:
         assert response.status_code == 200
         assert response.json['success'] == True
 
+class TestCheckoutAdmission:
+    """Test the checkout waiting room"""
+    
+    def test_caps_concurrency_and_admits_fifo(self):
+        """Overflow is queued and admitted in arrival order"""
+        now = [0.0]
+        controller = AdmissionController(max_concurrent=1, clock=lambda: now[0])
+        
+        assert controller.try_admit() == (True, None)
+        _, first = controller.try_admit()
+        _, second = controller.try_admit()
+        assert (first['position'], second['position']) == (1, 2)
+        assert controller.status()['queue_depth'] == 2
+        
+        controller.release()
+        # The second ticket can't jump ahead of the first
+        assert controller.try_admit(second['queue_token'])[0] is False
+        assert controller.try_admit(first['queue_token']) == (True, None)
+        controller.release()
+        assert controller.try_admit(second['queue_token']) == (True, None)
+    
+    def test_abandoned_tokens_expire(self):
+        """Clients that stop polling lose their place"""
+        now = [0.0]
+        controller = AdmissionController(max_concurrent=1, token_ttl=10, clock=lambda: now[0])
+        controller.try_admit()
+        _, ticket = controller.try_admit()
+        
+        now[0] = 11.0
+        assert controller.position(ticket['queue_token']) is None
+        assert controller.status()['expired_total'] == 1
+    
+    def test_full_waiting_room_rejects(self):
+        """Arrivals beyond max_queue are turned away"""
+        controller = AdmissionController(max_concurrent=1, max_queue=1)
+        controller.try_admit()
+        controller.try_admit()
+        assert controller.try_admit() == (False, None)
+    
+    def test_checkout_queued_when_busy(self, client, sample_user, sample_product):
+        """A busy node hands out a queue token that is honoured on retry"""
+        client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        client.post('/api/cart/add', json={'product_id': sample_product.id, 'quantity': 1})
+        
+        for _ in range(checkout_admission.max_concurrent):
+            checkout_admission.try_admit()
+        try:
+            response = client.post('/api/checkout/process', json={'shipping_address': '1 Test St'})
+            assert response.status_code == 503
+            assert response.json['queued'] is True
+            assert 'Retry-After' in response.headers
+            token = response.json['queue_token']
+            
+            status = client.get('/api/checkout/queue').json['queue']
+            assert status['queue_depth'] == 1
+        finally:
+            for _ in range(checkout_admission.max_concurrent):
+                checkout_admission.release()
+        
+        response = client.post('/api/checkout/process', json={'shipping_address': '1 Test St'},
+                               headers={'X-Queue-Token': token})
+        assert response.status_code == 201
+        assert checkout_admission.status()['active'] == 0
+
+class TestChat:
+    """Test Socket.IO chat handlers"""
+    
+    def test_bot_reply_does_not_block_senders(self, app):
+        """Many simultaneous senders are handled without waiting on the bot"""
+        app.config['CHAT_BOT_REPLY_DELAY'] = 0.2
+        clients = [socketio.test_client(app) for _ in range(20)]
+        for i, sio in enumerate(clients):
+            sio.emit('join_chat', {'session_id': f'session-{i}', 'username': f'user{i}'})
+            sio.get_received()
+        
+        started = time.perf_counter()
+        for i, sio in enumerate(clients):
+            sio.emit('send_message', {'session_id': f'session-{i}', 'message': 'hello', 'username': f'user{i}'})
+        elapsed = time.perf_counter() - started
+        
+        # Serialized replies would take 20 * 0.2s
+        assert elapsed < 0.2 * len(clients) / 2
+        for sio in clients:
+            received = sio.get_received()
+            assert [e['name'] for e in received] == ['new_message', 'user_typing']
+        
+        socketio.sleep(0.5)
+        for sio in clients:
+            names = [e['name'] for e in sio.get_received()]
+            assert names == ['new_message', 'user_typing']
+            sio.disconnect()
+        assert ChatMessage.query.filter_by(username='Support Bot').count() == len(clients)
+    
+    def test_join_returns_latest_page_and_load_older_pages_back(self, app):
+        """History is sent a page at a time, newest page first"""
+        app.config['CHAT_HISTORY_PAGE_SIZE'] = 10
+        for i in range(25):
+            db.session.add(ChatMessage(session_id='history', username='user', message=f'msg {i}'))
+        db.session.commit()
+        
+        sio = socketio.test_client(app)
+        sio.emit('join_chat', {'session_id': 'history', 'username': 'user'})
+        joined = [e for e in sio.get_received() if e['name'] == 'chat_joined'][0]['args'][0]
+        assert [m['message'] for m in joined['messages']] == [f'msg {i}' for i in range(15, 25)]
+        assert joined['has_more'] is True
+        
+        seen = joined['messages']
+        cursor = joined['cursor']
+        while cursor:
+            sio.emit('load_older', {'session_id': 'history', 'before': cursor})
+            page = sio.get_received()[0]['args'][0]
+            seen = page['messages'] + seen
+            cursor = page['cursor']
+        
+        assert [m['message'] for m in seen] == [f'msg {i}' for i in range(25)]
+        sio.disconnect()
+
+class TestChatWriter:
+    """Test write-behind chat persistence"""
+    
+    def row(self, i):
+        return {'session_id': 'batch', 'username': 'user', 'message': f'msg {i}', 'is_support': False}
+    
+    def test_flushes_when_batch_is_full(self, app):
+        """Rows are inserted together once batch_size is reached"""
+        chat_writer.batch_size = 5
+        for i in range(4):
+            chat_writer.submit(self.row(i))
+        assert ChatMessage.query.count() == 0
+        assert chat_writer.pending() == 4
+        
+        chat_writer.submit(self.row(4))
+        assert ChatMessage.query.count() == 5
+        assert chat_writer.stats()['batches'] == 1
+    
+    def test_flushes_on_interval(self, app):
+        """A partial batch is written after the flush interval"""
+        chat_writer.flush_interval = 0.05
+        chat_writer.submit(self.row(0))
+        socketio.sleep(0.2)
+        assert ChatMessage.query.count() == 1
+    
+    def test_full_buffer_applies_backpressure(self, app):
+        """Producers write inline instead of growing the buffer past max_buffer"""
+        chat_writer.max_buffer = 3
+        for i in range(3):
+            chat_writer.submit(self.row(i))
+        assert chat_writer.pending() == 0
+        assert chat_writer.stats()['inline_flushes'] == 1
+        assert ChatMessage.query.count() == 3
+    
+    def test_write_through_when_disabled(self, app):
+        """With write-behind off every message is committed immediately"""
+        chat_writer.enabled = False
+        chat_writer.submit(self.row(0))
+        assert ChatMessage.query.count() == 1
+
+class TestIntents:
+    """Test the support bot intent engine"""
+    
+    def test_matches_whole_words_only(self):
+        """'hi' no longer fires inside 'shipping' or 'this'"""
+        compiled = CompiledIntents(DEFAULT_INTENTS)
+        assert compiled.match('How long does shipping take?')['name'] == 'shipping'
+        assert compiled.match('this is odd') is None
+        assert compiled.match('Hi there')['name'] == 'greeting'
+    
+    def test_highest_priority_intent_wins(self):
+        """The best intent is chosen regardless of where it appears"""
+        compiled = CompiledIntents(DEFAULT_INTENTS)
+        assert compiled.match('thanks, I want a refund')['name'] == 'returns'
+        assert compiled.match('Cancelled ORDERS')['name'] == 'order_tracking'
+    
+    def test_database_rules_hot_reload(self, client, sample_user):
+        """Rules added through the API are used for the next reply"""
+        assert intent_engine.respond('where is my warranty card') == FALLBACK_RESPONSE
+        
+        client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        response = client.post('/chat/intents', json={
+            'name': 'warranty',
+            'keywords': ['warrant*', 'guarantee'],
+            'response': 'All products carry a one year warranty.',
+            'priority': 95
+        })
+        assert response.status_code == 200
+        assert intent_engine.respond('where is my warranty card') == 'All products carry a one year warranty.'
+        # Built-in rules are still there
+        assert intent_engine.respond('hello') == DEFAULT_INTENTS[0]['response']
+        assert 'database' in client.get('/chat/intents').json['source']
+
+class TestPresence:
+    """Test the chat session registry"""
+    
+    def test_disconnect_cleans_up(self, app, client):
+        """Sessions are dropped when the socket goes away without leave_chat"""
+        first = socketio.test_client(app)
+        second = socketio.test_client(app)
+        first.emit('join_chat', {'session_id': 'room-1', 'username': 'alice'})
+        second.emit('join_chat', {'session_id': 'room-1', 'username': 'bob'})
+        assert client.get('/chat/presence').json['presence']['rooms'] == {'room-1': 2}
+        
+        first.disconnect()
+        stats = client.get('/chat/presence').json['presence']
+        assert stats['rooms'] == {'room-1': 1}
+        assert stats['nodes'] == {app.config['SERVER_NAME_ID']: 1}
+        assert any(e['name'] == 'user_left' for e in second.get_received())
+        second.disconnect()
+        assert presence.stats()['rooms'] == {}
+    
+    def test_redis_backend_is_shared_across_nodes(self):
+        """Two nodes on the same store see each other's connections"""
+        store = get_redis('memory://presence-test')
+        store.flushall()
+        node_a, node_b = PresenceRegistry(), PresenceRegistry()
+        node_a.backend, node_a.node = RedisPresenceBackend(store), 'node-a'
+        node_b.backend, node_b.node = RedisPresenceBackend(store), 'node-b'
+        
+        node_a.join('sid-1', 'room-1', 'alice')
+        node_b.join('sid-2', 'room-1', 'bob')
+        node_b.join('sid-3', 'room-2', 'carol')
+        stats = node_a.stats()
+        assert stats['rooms'] == {'room-1': 2, 'room-2': 1}
+        assert stats['nodes'] == {'node-a': 1, 'node-b': 2}
+        assert {m['username'] for m in node_a.room_members('room-1')} == {'alice', 'bob'}
+        
+        # A crashed node's sockets are purged when it comes back
+        node_b.backend.purge_node('node-b')
+        assert node_a.stats()['rooms'] == {'room-1': 1}
+        assert node_a.leave('sid-1')['username'] == 'alice'
+        assert node_a.stats() == {'node': 'node-a', 'rooms': {}, 'nodes': {}}
+
+class TestEventThrottle:
+    """Test coalescing of high-frequency Socket.IO events"""
+    
+    def make_throttle(self):
+        now = [0.0]
+        throttle = EventThrottle('typing', socketio, interval=0.5, idle_timeout=3.0,
+                                 idle_value=False, clock=lambda: now[0])
+        # Sweeps are driven by hand below
+        throttle._sweeper_started = True
+        return throttle, now
+    
+    def test_keystrokes_coalesce_into_one_change(self):
+        """Repeated 'typing' reports only broadcast the first state change"""
+        throttle, now = self.make_throttle()
+        sent = []
+        for i in range(20):
+            now[0] = i * 0.05
+            throttle.submit('alice', True, sent.append)
+        assert sent == [True]
+        assert throttle.stats()['suppressed'] == 19
+    
+    def test_changes_inside_interval_are_deferred(self):
+        """A stop right after a start is held until the interval ends"""
+        throttle, now = self.make_throttle()
+        sent = []
+        throttle.submit('alice', True, sent.append)
+        now[0] = 0.1
+        throttle.submit('alice', False, sent.append)
+        throttle.sweep()
+        assert sent == [True]
+        
+        now[0] = 0.6
+        throttle.sweep()
+        assert sent == [True, False]
+        assert throttle.stats()['deferred'] == 1
+    
+    def test_flicker_is_dropped_and_idle_times_out(self):
+        """on/off/on inside one interval sends nothing; silence sends 'stopped'"""
+        throttle, now = self.make_throttle()
+        sent = []
+        throttle.submit('alice', True, sent.append)
+        now[0] = 0.1
+        throttle.submit('alice', False, sent.append)
+        now[0] = 0.2
+        throttle.submit('alice', True, sent.append)
+        now[0] = 0.6
+        throttle.sweep()
+        assert sent == [True]
+        
+        now[0] = 3.3
+        throttle.sweep()
+        assert sent == [True, False]
+        assert throttle.stats()['idle_timeouts'] == 1
+    
+    def test_typing_handler_broadcasts_once(self, app, client):
+        """A burst of typing events reaches the other side as one update"""
+        typist = socketio.test_client(app)
+        watcher = socketio.test_client(app)
+        typist.emit('join_chat', {'session_id': 'room-t', 'username': 'alice'})
+        watcher.emit('join_chat', {'session_id': 'room-t', 'username': 'bob'})
+        watcher.get_received()
+        
+        for _ in range(10):
+            typist.emit('typing', {'session_id': 'room-t', 'username': 'alice', 'is_typing': True})
+        updates = [e for e in watcher.get_received() if e['name'] == 'user_typing']
+        assert len(updates) == 1
+        
+        stats = client.get('/chat/throttles').json['throttles']['typing']
+        assert stats['received'] == 10 and stats['suppressed'] == 9
+        
+        # Leaving mid-word clears the indicator for everyone else
+        typist.disconnect()
+        updates = [e['args'][0] for e in watcher.get_received() if e['name'] == 'user_typing']
+        assert updates == [{'username': 'alice', 'is_typing': False}]
+        watcher.disconnect()
+
+class TestSupportQueue:
+    """Test support agent routing"""
+    
+    def test_assigns_to_least_loaded_agent(self):
+        """Sessions spread across agents by load relative to capacity"""
+        queue = SupportQueue()
+        queue.register_agent('a', 'Alice', capacity=2)
+        queue.register_agent('b', 'Bob', capacity=4)
+        agents = [queue.request(f's{i}')[0]['agent_id'] for i in range(6)]
+        assert agents.count('a') == 2 and agents.count('b') == 4
+        # Everyone is full now
+        assert queue.request('s6') == []
+        assert queue.stats()['waiting'] == 1
+    
+    def test_priority_then_fifo(self):
+        """Higher priority first, then longest waiting"""
+        now = [0.0]
+        queue = SupportQueue(clock=lambda: now[0])
+        for i, priority in enumerate([0, 1, 0, 1]):
+            now[0] = i
+            queue.request(f's{i}', priority=priority)
+        now[0] = 10
+        assigned = [a['session_id'] for a in queue.register_agent('a', 'Alice', capacity=4)]
+        assert assigned == ['s1', 's3', 's0', 's2']
+        assert queue.stats()['wait_percentiles']['p50'] == 8
+    
+    def test_agent_disconnect_reassigns(self):
+        """A departing agent's sessions move to the remaining agents"""
+        queue = SupportQueue()
+        queue.register_agent('a', 'Alice', capacity=1)
+        queue.request('s0')
+        queue.register_agent('b', 'Bob', capacity=1)
+        assert queue.agent_for('s0') == 'a'
+        
+        moved = queue.unregister_agent('a')
+        assert [(m['session_id'], m['agent_id']) for m in moved] == [('s0', 'b')]
+        assert queue.release('s0') == []
+        assert queue.stats()['agents'][0]['load'] == 0
+    
+    def test_scales_to_thousands_waiting(self):
+        """Queueing, cancelling and draining 5000 sessions stays fast"""
+        queue = SupportQueue()
+        started = time.perf_counter()
+        for i in range(5000):
+            queue.request(f's{i}', priority=i % 3)
+        for i in range(0, 5000, 2):
+            queue.cancel(f's{i}')
+        queue.register_agent('a', 'Alice', capacity=10000)
+        assert queue.stats()['assigned'] == 2500
+        assert time.perf_counter() - started < 1.0
+    
+    def test_agent_receives_only_their_sessions(self, app, client, sample_user):
+        """support_request alerts the assigned agent, not every agent"""
+        client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        agent = socketio.test_client(app, flask_test_client=client)
+        agent.emit('agent_register', {'name': 'Alice', 'capacity': 1})
+        agent.get_received()
+        
+        customer = socketio.test_client(app)
+        customer.emit('join_chat', {'session_id': 'help-1', 'username': 'carol'})
+        customer.emit('support_request', {'session_id': 'help-1', 'username': 'carol'})
+        alerts = [e['args'][0] for e in agent.get_received() if e['name'] == 'support_alert']
+        assert [a['session_id'] for a in alerts] == ['help-1']
+        assert any(e['name'] == 'user_joined' for e in customer.get_received())
+        
+        stats = client.get('/chat/support/queue').json['queue']
+        assert stats['assigned'] == 1 and stats['agents'][0]['load'] == 1
+        
+        agent.disconnect()
+        assert client.get('/chat/support/queue').json['queue']['waiting'] == 1
+        customer.disconnect()
+        assert client.get('/chat/support/queue').json['queue']['waiting'] == 0
+
+class TestChatSearch:
+    """Test full-text search over chat transcripts"""
+    
+    def _seed(self, app):
+        from datetime import datetime
+        with app.app_context():
+            chat_writer.submit({'session_id': 'order-1', 'username': 'alice', 'message': 'Where is my refund for order 1042?',
+                                'is_support': False, 'user_id': None, 'timestamp': datetime(2026, 3, 1, 9, 0)})
+            chat_writer.submit({'session_id': 'order-1', 'username': 'Support Bot', 'message': 'Refunds take 5-7 business days.',
+                                'is_support': True, 'user_id': None, 'timestamp': datetime(2026, 3, 1, 9, 1)})
+            chat_writer.submit({'session_id': 'order-2', 'username': 'bob', 'message': 'I was refunded twice',
+                                'is_support': False, 'user_id': None, 'timestamp': datetime(2026, 3, 5, 12, 0)})
+            chat_writer.submit({'session_id': 'order-3', 'username': 'carol', 'message': 'Shipping to Canada?',
+                                'is_support': False, 'user_id': None, 'timestamp': datetime(2026, 3, 6, 8, 0)})
+    
+    def test_search_requires_login(self, client):
+        """Transcript search is for signed-in staff"""
+        assert client.get('/chat/search?q=refund').status_code in (302, 401)
+    
+    def test_search_matches_new_messages(self, app, client, sample_user):
+        """Messages written through the batch writer are searchable straight away"""
+        client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        self._seed(app)
+        
+        data = client.get('/chat/search?q=refund*').json
+        assert [m['username'] for m in data['messages']] == ['bob', 'Support Bot', 'alice']
+        assert client.get('/chat/search?q=carol').json['messages'][0]['session_id'] == 'order-3'
+        assert client.get('/chat/search?q="order 1042"').json['messages'][0]['username'] == 'alice'
+    
+    def test_search_filters_and_cursor(self, app, client, sample_user):
+        """Date range and is_support filters, and cursor paging"""
+        client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        self._seed(app)
+        
+        data = client.get('/chat/search?q=refund*&from=2026-03-01&to=2026-03-01').json
+        assert len(data['messages']) == 2
+        data = client.get('/chat/search?q=refund*&is_support=true').json
+        assert [m['username'] for m in data['messages']] == ['Support Bot']
+        
+        first = client.get('/chat/search?q=refund*&limit=2').json
+        assert first['has_more'] and len(first['messages']) == 2
+        rest = client.get(f"/chat/search?q=refund*&limit=2&cursor={first['cursor']}").json
+        assert [m['username'] for m in rest['messages']] == ['alice'] and not rest['has_more']
+    
+    def test_index_follows_updates_and_deletes(self, app):
+        """Triggers keep the index in step with edits"""
+        from app.chat_search import search_messages
+        self._seed(app)
+        with app.app_context():
+            chat_writer.flush()
+            message = ChatMessage.query.filter_by(username='carol').first()
+            message.message = 'Do you ship to Mexico?'
+            db.session.commit()
+            assert search_messages('canada')[0] == []
+            assert len(search_messages('mexico')[0]) == 1
+            db.session.delete(message)
+            db.session.commit()
+            assert search_messages('mexico')[0] == []
+
+class TestIdentityCache:
+    """Test the Flask-Login identity cache"""
+    
+    def _count_queries(self, app, fn):
+        from sqlalchemy import event
+        statements = []
+        def record(conn, cursor, statement, *args):
+            statements.append(statement)
+        with app.app_context():
+            engine = db.engine
+        event.listen(engine, 'before_cursor_execute', record)
+        try:
+            fn()
+        finally:
+            event.remove(engine, 'before_cursor_execute', record)
+        return statements
+    
+    def test_authenticated_request_needs_no_identity_query(self, app, client, sample_user):
+        """After login the user comes from the cache, not the database"""
+        client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        
+        # A fresh app context per request, as in production (no g or session reuse)
+        def request():
+            with app.app_context():
+                responses.append(client.get('/auth/current-user'))
+        responses = []
+        statements = self._count_queries(app, request)
+        assert responses[0].json['user']['username'] == 'testuser'
+        assert statements == []
+        assert client.get('/auth/identity-cache').json['cache']['hits'] >= 1
+    
+    def test_update_profile_invalidates(self, app, client, sample_user):
+        """Profile changes are visible on the next request"""
+        client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        with app.app_context():
+            client.get('/auth/current-user')
+        with app.app_context():
+            response = client.put('/auth/update-profile', json={'full_name': 'New Name'})
+            assert response.status_code == 200
+        with app.app_context():
+            assert client.get('/auth/current-user').json['user']['full_name'] == 'New Name'
+        assert identity_cache.stats()['invalidations'] == 1
+    
+    def test_cached_user_can_still_check_password(self, app, sample_user):
+        """The password hash is not cached but loads on demand"""
+        user_id = sample_user.id
+        with app.app_context():
+            identity_cache.load(user_id)
+        with app.app_context():
+            user = identity_cache.load(user_id)
+            assert identity_cache.stats()['hits'] == 1
+            assert user.check_password('password123')
+    
+    def test_memory_backend_is_bounded(self):
+        """Least recently used entries are evicted first"""
+        backend = MemoryIdentityBackend(max_size=2)
+        backend.set(1, {'id': 1}, 60)
+        backend.set(2, {'id': 2}, 60)
+        backend.get(1)
+        backend.set(3, {'id': 3}, 60)
+        assert backend.get(2) is None and backend.get(1) and backend.get(3)
+        assert backend.size() == 2
+    
+    def test_shared_backend_invalidates_across_nodes(self):
+        """An invalidation on one node is seen by the others"""
+        client = get_redis('memory://identity-test')
+        client.flushall()
+        node_a, node_b = RedisIdentityBackend(client), RedisIdentityBackend(client)
+        node_a.set(7, {'id': 7, 'username': 'x'}, 60)
+        assert node_b.get(7)['username'] == 'x'
+        node_b.delete(7)
+        assert node_a.get(7) is None
+
+class TestPasswordHashing:
+    """Test pooled password hashing and rehash on login"""
+    
+    def test_hashing_runs_off_the_calling_thread(self):
+        """Every pool mode except inline hashes in another OS thread"""
+        import threading
+        hasher = PasswordHasher(socketio)
+        for mode in ('tpool', 'thread'):
+            hasher.executor = mode
+            assert hasher._run(threading.get_ident) != threading.get_ident()
+        hasher.executor = 'inline'
+        assert hasher._run(threading.get_ident) == threading.get_ident()
+        hasher.shutdown()
+    
+    def test_normalize_method(self):
+        """Werkzeug defaults are filled in so settings compare with stored hashes"""
+        assert normalize_method('scrypt') == 'scrypt:32768:8:1'
+        assert normalize_method('pbkdf2:sha256').startswith('pbkdf2:sha256:')
+        assert normalize_method('pbkdf2:sha512:1000') == 'pbkdf2:sha512:1000'
+    
+    def test_login_rehashes_outdated_hash(self, app, client):
+        """A hash made with old settings is upgraded on the next login"""
+        from werkzeug.security import generate_password_hash
+        user = User(username='legacy', email='legacy@example.com',
+                    password_hash=generate_password_hash('secret', method='pbkdf2:sha256:500'))
+        db.session.add(user)
+        db.session.commit()
+        
+        response = client.post('/auth/login', json={'username': 'legacy', 'password': 'secret'})
+        assert response.status_code == 200
+        stored = db.session.get(User, user.id).password_hash
+        assert stored.startswith('pbkdf2:sha256:1000$')
+        assert not user.password_needs_rehash()
+        
+        client.post('/auth/logout')
+        assert client.post('/auth/login', json={'username': 'legacy', 'password': 'secret'}).status_code == 200
+
+class TestRateLimit:
+    """Test token-bucket rate limiting"""
+    
+    def test_login_limited_per_username(self, client):
+        """Repeated attempts on one account get 429 with Retry-After"""
+        for _ in range(5):
+            response = client.post('/auth/login', json={'username': 'victim', 'password': 'guess'})
+            assert response.status_code == 401
+        response = client.post('/auth/login', json={'username': 'Victim', 'password': 'guess'})
+        assert response.status_code == 429
+        assert int(response.headers['Retry-After']) >= 1
+        
+        # Other accounts from the same client are still allowed (IP burst is higher)
+        response = client.post('/auth/login', json={'username': 'someone', 'password': 'guess'})
+        assert response.status_code == 401
+    
+    def test_login_limited_per_ip(self, client):
+        """Spraying many usernames from one IP hits the IP bucket"""
+        statuses = [client.post('/auth/login', json={'username': f'user{i}', 'password': 'x'}).status_code
+                    for i in range(11)]
+        assert statuses[:10] == [401] * 10 and statuses[10] == 429
+        assert rate_limiter.stats()['login_ip']['limited'] == 1
+    
+    def test_bucket_refills(self):
+        """Tokens come back at the configured rate"""
+        now = [0.0]
+        backend = MemoryRateLimitBackend(clock=lambda: now[0])
+        assert [backend.take('k', 1.0, 2) >= 0 for _ in range(3)] == [True, True, False]
+        now[0] += 1.0
+        assert backend.take('k', 1.0, 2) >= 0
+        assert backend.take('k', 1.0, 2) < 0
+    
+    def test_shared_backend_counts_across_nodes(self):
+        """Two nodes pointed at one store share the bucket"""
+        client = get_redis('memory://ratelimit-test')
+        client.flushall()
+        node_a, node_b = RedisRateLimitBackend(client), RedisRateLimitBackend(client)
+        assert node_a.take('login_user:bob', 0.01, 2) >= 0
+        assert node_b.take('login_user:bob', 0.01, 2) >= 0
+        assert node_a.take('login_user:bob', 0.01, 2) < 0
+    
+    def test_check_overhead(self, app):
+        """A check costs microseconds"""
+        started = time.perf_counter()
+        for i in range(10000):
+            rate_limiter.hit('cart', i % 100)
+        assert (time.perf_counter() - started) / 10000 < 50e-6
+    
+    def test_chat_messages_limited_per_connection(self, app):
+        """Flooding send_message gets an error instead of broadcasts"""
+        client = socketio.test_client(app)
+        client.emit('join_chat', {'session_id': 'flood', 'username': 'spam'})
+        client.get_received()
+        for i in range(12):
+            client.emit('send_message', {'session_id': 'flood', 'username': 'spam', 'message': f'm{i}'})
+        received = client.get_received()
+        assert len([e for e in received if e['name'] == 'new_message']) == 10
+        errors = [e['args'][0] for e in received if e['name'] == 'error']
+        assert errors and errors[0]['rate_limited']
+        client.disconnect()
+
+class TestSessions:
+    """Test server-side sessions"""
+    
+    def _login(self, app):
+        client = app.test_client()
+        client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        return client
+    
+    def test_cookie_holds_only_a_compact_id(self, app, sample_user):
+        """Session data stays on the server"""
+        client = self._login(app)
+        sid = client.get_cookie('session').value
+        assert len(sid) == 22
+        assert session_store.store.get(sid)['_user_id'] == str(sample_user.id)
+    
+    def test_store_only_touched_when_session_is_read(self, app, sample_user, monkeypatch):
+        """Requests that don't use the session never load or save it"""
+        client = self._login(app)
+        calls = []
+        store = session_store.store
+        monkeypatch.setattr(store, 'get', lambda sid, get=store.get: calls.append('get') or get(sid))
+        monkeypatch.setattr(store, 'set', lambda *args, set_=store.set: calls.append('set') or set_(*args))
+        
+        with app.app_context():
+            assert client.get('/api/products/').status_code == 200
+        assert calls == []
+        with app.app_context():
+            assert client.get('/auth/current-user').status_code == 200
+        assert calls == ['get']
+    
+    def test_logout_all_revokes_every_session(self, app, sample_user):
+        """Signing out everywhere ends sessions on other devices too"""
+        get_redis(app.config['SESSION_REDIS_URL']).flushall()
+        laptop, phone = self._login(app), self._login(app)
+        assert laptop.get_cookie('session').value != phone.get_cookie('session').value
+        
+        response = laptop.post('/auth/logout-all')
+        assert response.json['sessions_revoked'] == 2
+        with app.app_context():
+            assert phone.get('/auth/current-user').status_code in (302, 401)
+    
+    def test_filesystem_store_revokes_by_user(self, tmp_path):
+        """The filesystem backend expires and revokes sessions"""
+        store = FilesystemSessionStore(str(tmp_path))
+        store.set('a', {'_user_id': '1'}, 60, '1')
+        store.set('b', {'_user_id': '2'}, 60, '2')
+        store.set('c', {'_user_id': '1'}, -1, '1')
+        assert store.get('a') == {'_user_id': '1'}
+        assert store.get('c') is None
+        assert store.revoke_user(1) == 1
+        assert store.get('a') is None and store.get('b')
+
+class TestMetrics:
+    """Test request and Socket.IO metrics"""
+    
+    def test_requests_recorded_per_endpoint(self, client, sample_product):
+        """Counts, status codes and latency histograms in Prometheus format"""
+        client.get('/api/products/')
+        client.get('/api/products/')
+        client.get('/api/products/999999')
+        
+        text = client.get('/metrics').get_data(as_text=True)
+        assert ('http_requests_total{blueprint="products",endpoint="products.get_products",'
+                'method="GET",status="200"} 2') in text
+        assert 'status="404"' in text
+        assert ('http_request_duration_seconds_count{blueprint="products",'
+                'endpoint="products.get_products"} 2') in text
+        assert 'le="+Inf"' in text
+        
+        summary = client.get('/metrics?format=json').json['metrics']['endpoints']['products.get_products']
+        assert summary['count'] == 2 and summary['status'] == {'200': 2}
+        assert 0 <= summary['p50'] <= summary['p95'] <= summary['p99']
+    
+    def test_socketio_events_recorded(self, app, client):
+        """Chat handlers are counted and timed by event name"""
+        sio = socketio.test_client(app)
+        sio.emit('join_chat', {'session_id': 'metrics-room', 'username': 'ann'})
+        sio.disconnect()
+        text = client.get('/metrics').get_data(as_text=True)
+        assert 'socketio_events_total{event="join_chat",outcome="ok"} 1' in text
+        assert 'socketio_event_duration_seconds_count{event="join_chat"} 1' in text
+    
+    def test_histogram_quantiles(self):
+        """Quantiles interpolate inside the bucket, like histogram_quantile()"""
+        histogram = Histogram((0.1, 0.2, 0.4))
+        for value in [0.05] * 50 + [0.15] * 40 + [0.3] * 10:
+            histogram.observe(value)
+        assert histogram.quantile(0.5) == pytest.approx(0.1)
+        assert histogram.quantile(0.95) == pytest.approx(0.3)
+        assert histogram.count == 100
+    
+    def test_recording_overhead(self):
+        """Recording a request costs microseconds"""
+        metrics = Metrics()
+        started = time.perf_counter()
+        for i in range(10000):
+            metrics.observe_request('products', 'products.get_products', 'GET', 200, 0.003)
+        assert (time.perf_counter() - started) / 10000 < 20e-6
+
+class TestQueryStats:
+    """Test SQL query instrumentation"""
+    
+    def _fill_cart(self, client, count):
+        for i in range(count):
+            product = Product(name=f'Item {i}', description='x', price=1.0 + i,
+                              category='Test', stock_quantity=10)
+            db.session.add(product)
+            db.session.commit()
+            client.post('/api/cart/add', json={'product_id': product.id, 'quantity': 1})
+    
+    def test_cart_stays_within_query_budget(self, app, client, sample_user):
+        """Listing the cart doesn't load each product separately"""
+        client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        self._fill_cart(client, 6)
+        with app.app_context():
+            with query_budget(2):
+                response = client.get('/api/cart/')
+        assert response.json['item_count'] == 6
+    
+    def test_budget_reports_repeated_statements(self, app, sample_user):
+        """An exceeded budget lists the statements, repeats first"""
+        user_id = sample_user.id
+        with pytest.raises(AssertionError, match='5x SELECT'):
+            with query_budget(3):
+                for _ in range(5):
+                    db.session.get(User, user_id, populate_existing=True)
+    
+    def test_lazy_loads_in_a_loop_are_flagged(self, app, client, sample_user):
+        """The same statement run once per row shows up as a repeated shape"""
+        client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        self._fill_cart(client, 6)
+        with app.app_context():
+            items = CartItem.query.all()
+            with track_queries() as tracker:
+                [item.product.name for item in items]
+        (statement, times), = tracker.repeated(5)
+        assert times == 6 and statement.startswith('SELECT products.')
+    
+    def test_debug_headers_and_metrics(self, app, client, sample_user):
+        """Counts go out as X-Query-* headers in debug mode and to /metrics"""
+        from app import query_inspector
+        client.post('/auth/login', json={'username': 'testuser', 'password': 'password123'})
+        self._fill_cart(client, 2)
+        query_inspector.debug_headers = True
+        
+        with app.app_context():
+            response = client.get('/api/cart/')
+        assert int(response.headers['X-Query-Count']) >= 1
+        assert float(response.headers['X-Query-Time-Ms']) >= 0
+        assert response.headers['X-Query-Suspected-N-Plus-One'] == '0'
+        
+        text = client.get('/metrics').get_data(as_text=True)
+        assert 'db_queries_per_request_count{blueprint="cart",endpoint="cart.add_to_cart"} 2' in text
+        assert 'db_query_seconds_total{blueprint="cart",endpoint="cart.get_cart"}' in text
+
+class TestConnectionPool:
+    """Test connection pool settings and monitoring"""
+    
+    def _config(self, uri, **overrides):
+        return {'SQLALCHEMY_DATABASE_URI': uri, 'SQLALCHEMY_ENGINE_OPTIONS': overrides,
+                'DB_POOL_SIZE': 3, 'DB_MAX_OVERFLOW': 2, 'DB_POOL_TIMEOUT': 5,
+                'DB_POOL_RECYCLE': 1800, 'DB_POOL_PRE_PING': True}
+    
+    def test_engine_options_from_config(self):
+        """Pool settings apply to real databases; explicit engine options win"""
+        options = engine_options(self._config('postgresql://shop@db/shop', pool_size=7))
+        assert options['poolclass'] is InstrumentedQueuePool
+        assert options['pool_size'] == 7 and options['max_overflow'] == 2
+        assert options['pool_recycle'] == 1800 and options['pool_pre_ping'] is True
+        assert engine_options(self._config('sqlite:///:memory:')) == {}
+    
+    def test_checkout_wait_and_saturation(self, tmp_path):
+        """In-use and overflow counts, checkout waits and timeouts are recorded"""
+        from sqlalchemy import create_engine, exc
+        engine = create_engine(f'sqlite:///{tmp_path}/pool.db', poolclass=InstrumentedQueuePool,
+                               pool_size=1, max_overflow=1, pool_timeout=0.05)
+        first, second = engine.connect(), engine.connect()
+        stats = engine.pool.pool_stats()
+        assert stats['checked_out'] == 2 and stats['overflow'] == 1 and stats['saturation'] == 1.0
+        
+        with pytest.raises(exc.TimeoutError):
+            engine.connect()
+        stats = engine.pool.pool_stats()
+        assert stats['timeouts'] == 1 and stats['checkouts'] == 3
+        assert stats['wait_p99'] >= 0.05
+        
+        first.close()
+        second.close()
+        assert engine.pool.pool_stats()['checked_out'] == 0
+        engine.dispose()
+    
+    def test_pool_reported_in_metrics(self, tmp_path, monkeypatch):
+        """A pooled database shows up in /metrics and its JSON summary"""
+        from config import TestingConfig
+        monkeypatch.setattr(TestingConfig, 'SQLALCHEMY_DATABASE_URI', f'sqlite:///{tmp_path}/shop.db')
+        app = create_app('testing')
+        with app.app_context():
+            db.create_all()
+            client = app.test_client()
+            client.get('/api/products/')
+            text = client.get('/metrics').get_data(as_text=True)
+            assert 'db_pool_size 5' in text
+            assert 'db_pool_checkout_wait_seconds_count' in text
+            pool = client.get('/metrics?format=json').json['metrics']['db_pool']
+            assert pool['pool'] == 'InstrumentedQueuePool' and pool['checkouts'] >= 1
+            db.session.remove()
+            db.engine.dispose()
+
 if __name__ == '__main__':
     pytest.main([__file__, '-v'])